@@ -0,0 +1,176 @@
+# Run one task per vertex of a dependency graph, in parallel where the graph
+# allows it.
+#
+# Works on anything with verts() and successors(vert), i.e. graph.Graph and
+# algraph.ALGraph. A vertex is submitted as soon as its last predecessor
+# finishes, not when its whole Kahn layer is reached, so a slow task only
+# holds up what actually depends on it. If a task raises, every vertex
+# downstream of it is skipped and the rest of the graph still runs.
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import time
+
+# start and end are time.time() stamps taken inside the worker
+Timing = namedtuple("Timing", ["start", "end", "elapsed"])
+
+
+def timedCall(task, vert):
+    """Run task(vert) and time it where it runs, as (result, error, start,
+    end): a task that raises comes back with its exception as error, so its
+    timing is kept. Module level so a process pool can pickle it."""
+    start = time.time()
+    try:
+        result, error = task(vert), None
+    except Exception as err:
+        result, error = None, err
+    end = time.time()
+    return result, error, start, end
+
+
+class DagRun:
+    """Outcome of runDag.
+
+    results, errors and timings are keyed by vertex; timings covers every
+    task that ran, failed ones included. skipped maps each vertex that never
+    ran to the failed predecessor that blocked it.
+    """
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.skipped = {}
+        self.timings = {}
+        self.wallTime = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors and not self.skipped
+
+    def busyTime(self):
+        return sum(timing.elapsed for timing in self.timings.values())
+
+    def criticalPath(self, graph):
+        """Longest chain of successful tasks by summed task time, as
+        (seconds, [verts])."""
+        # a task starts after all its predecessors ended, so start order is
+        # a topological order of the completed tasks
+        best = dict.fromkeys(self.results, (0.0, None))
+        for vert in sorted(self.results, key=lambda v: self.timings[v].start):
+            length, prev = best[vert]
+            length += self.timings[vert].elapsed
+            best[vert] = (length, prev)
+            for succ in graph.successors(vert):
+                if succ in best and best[succ][0] < length:
+                    best[succ] = (length, vert)
+        if not best:
+            return 0.0, []
+        vert = max(best, key=lambda v: best[v][0])
+        length = best[vert][0]
+        path = []
+        while vert is not None:
+            path.append(vert)
+            vert = best[vert][1]
+        return length, path[::-1]
+
+    def summary(self):
+        lines = [f"{len(self.results)} ok, {len(self.errors)} failed, {len(self.skipped)} skipped "
+                 f"in {self.wallTime:.3f}s wall, {self.busyTime():.3f}s busy"]
+        for vert, timing in sorted(self.timings.items(), key=lambda item: item[1].start):
+            lines.append(f"  {vert!s:>10} {timing.elapsed:8.3f}s")
+        for vert, err in self.errors.items():
+            lines.append(f"  {vert!s:>10}   failed: {err!r}")
+        for vert, blocker in self.skipped.items():
+            lines.append(f"  {vert!s:>10}   skipped, blocked by {blocker}")
+        return "\n".join(lines)
+
+
+def runDag(graph, task, maxWorkers=None, executor="thread"):
+    """Call task(vert) for every vertex once all its predecessors succeeded.
+
+    executor is "thread", "process" or an existing concurrent.futures
+    executor (left open). maxWorkers caps how many tasks run at once. With a
+    process pool, task must be picklable (a module-level function).
+    Raises ValueError before running anything if the graph has a cycle.
+    """
+    graph.findTopologicalLayers()   # cycle check
+
+    indegree = dict.fromkeys(graph.verts(), 0)
+    for vert in indegree:
+        for succ in graph.successors(vert):
+            indegree[succ] += 1
+
+    if executor == "thread":
+        pool, ownPool = ThreadPoolExecutor(maxWorkers), True
+    elif executor == "process":
+        pool, ownPool = ProcessPoolExecutor(maxWorkers), True
+    else:
+        pool, ownPool = executor, False
+
+    run = DagRun()
+    running = {}
+    start = time.perf_counter()
+
+    def skip(vert, blocker):
+        stack = [vert]
+        while stack:
+            vert = stack.pop()
+            if vert in run.skipped:
+                continue
+            run.skipped[vert] = blocker
+            stack.extend(graph.successors(vert))
+
+    try:
+        for vert, count in indegree.items():
+            if count == 0:
+                running[pool.submit(timedCall, task, vert)] = vert
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                vert = running.pop(future)
+                try:
+                    result, error, taskStart, taskEnd = future.result()
+                    run.timings[vert] = Timing(taskStart, taskEnd, taskEnd - taskStart)
+                except Exception as err:
+                    # the pool itself failed (e.g. a task that cannot be pickled)
+                    error = err
+                if error is not None:
+                    run.errors[vert] = error
+                    for succ in graph.successors(vert):
+                        skip(succ, vert)
+                    continue
+                run.results[vert] = result
+                for succ in graph.successors(vert):
+                    indegree[succ] -= 1
+                    if indegree[succ] == 0 and succ not in run.skipped:
+                        running[pool.submit(timedCall, task, succ)] = succ
+    finally:
+        if ownPool:
+            pool.shutdown()
+    run.wallTime = time.perf_counter() - start
+    return run
+
+
+def sleepTask(vert):
+    time.sleep(0.05 * (vert % 4 + 1))
+    if vert == 7:
+        raise RuntimeError(f"task {vert} failed")
+    return vert * vert
+
+
+if __name__ == "__main__":
+    from algraph import ALGraph
+    from graph import Edge, Graph
+
+    edges = [[0, 2], [1, 2], [2, 3], [2, 4], [3, 5], [4, 5], [1, 6], [6, 7], [7, 8], [8, 9], [6, 10]]
+    graph = Graph()
+    graph.addEdges(Edge(v1, v2) for v1, v2 in edges)
+    algraph = ALGraph()
+    algraph.addEdges(edges)
+    for graph in (graph, algraph):
+        print(type(graph).__name__, "layers:", graph.findTopologicalLayers(),
+              "critical path length:", graph.criticalPathLength())
+        for executor in ("thread", "process"):
+            run = runDag(graph, sleepTask, maxWorkers=4, executor=executor)
+            print(f"[{executor}]", run.summary())
+            seconds, path = run.criticalPath(graph)
+            print(f"  critical path {path} {seconds:.3f}s")
@@ -0,0 +1,155 @@
+# Fast, seedable dice for the dnd scripts.
+#
+# Rolling a stat with random.randrange(1,7) three times costs three Python
+# calls. Dice instead draws bulk random bytes and maps them with
+# bytes.translate: a byte below 216 indexes one of the 6**3 equally likely
+# ordered 3d6 rolls and becomes its total, bytes 216..255 are deleted
+# (rejection sampling), so the totals are exactly 3d6 distributed and the
+# whole conversion runs in C.
+
+import os
+import random
+
+REFILL_SIZE = 1 << 16
+NUM_STATS = 6
+
+# byte -> 3d6 total for the 216 ordered rolls, everything above is rejected
+THREE_D6_TABLE = bytes(a + b + c for a in range(1, 7) for b in range(1, 7) for c in range(1, 7)) + bytes(40)
+THREE_D6_REJECT = bytes(range(216, 256))
+# byte -> d6 for 0..251 (42 of each face), 252..255 rejected
+D6_TABLE = bytes(b % 6 + 1 for b in range(252)) + bytes(4)
+D6_REJECT = bytes(range(252, 256))
+
+# exact probability of each 3d6 total
+THREE_D6_PROBABILITIES = {
+    total: sum(1 for roll in THREE_D6_TABLE[:216] if roll == total) / 216 for total in range(3, 19)
+}
+# chi-square critical value for 15 degrees of freedom at p = 0.001
+CHI_SQUARE_CRITICAL = 37.697
+
+
+class TranslatedBytes:
+    """Random bytes from rng mapped through table, with reject bytes dropped,
+    handed out in order from a buffer refilled REFILL_SIZE bytes at a time."""
+    def __init__(self, rng, table, reject):
+        self.rng = rng
+        self.table = table
+        self.reject = reject
+        self.buffer = b""
+        self.pos = 0
+
+    def getstate(self):
+        """The bytes still buffered; the rng's state is saved separately."""
+        return self.buffer[self.pos:]
+
+    def setstate(self, state):
+        self.buffer = state
+        self.pos = 0
+
+    def take(self, count):
+        pos = self.pos
+        if pos + count <= len(self.buffer):
+            self.pos = pos + count
+            return self.buffer[pos:pos + count]
+        chunks = [self.buffer[pos:]]
+        have = len(chunks[0])
+        while have < count:
+            chunk = self.rng.randbytes(REFILL_SIZE).translate(self.table, self.reject)
+            chunks.append(chunk)
+            have += len(chunk)
+        self.buffer = b"".join(chunks)
+        self.pos = count
+        return self.buffer[:count]
+
+
+class Dice:
+    """Seeded source of d6 and 3d6 results.
+
+    Each kind of roll is its own buffered stream, so as long as one kind is
+    used the results for a seed do not depend on how many are requested at a
+    time. substream(i) gives an
+    independent Dice for worker i, seeded only from this seed and i.
+    """
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(16), "little")
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.three_d6_stream = TranslatedBytes(self.rng, THREE_D6_TABLE, THREE_D6_REJECT)
+        self.d6_stream = TranslatedBytes(self.rng, D6_TABLE, D6_REJECT)
+
+    def getstate(self):
+        """Everything needed to continue the same streams, e.g. after a
+        checkpoint: setstate() on any Dice resumes exactly here."""
+        return self.seed, self.rng.getstate(), self.three_d6_stream.getstate(), self.d6_stream.getstate()
+
+    def setstate(self, state):
+        self.seed, rng_state, three_d6_state, d6_state = state
+        self.rng.setstate(rng_state)
+        self.three_d6_stream.setstate(three_d6_state)
+        self.d6_stream.setstate(d6_state)
+
+    def substream(self, index):
+        return Dice(f"{self.seed}/{index}")
+
+    def substreams(self, count):
+        return [self.substream(i) for i in range(count)]
+
+    def three_d6(self, count):
+        """count 3d6 totals as bytes."""
+        return self.three_d6_stream.take(count)
+
+    def d6(self, count):
+        """count d6 results as bytes."""
+        return self.d6_stream.take(count)
+
+    def stat_block(self, num_stats=NUM_STATS):
+        """One character's stats (3d6 each) as a list."""
+        return list(self.three_d6_stream.take(num_stats))
+
+    def stat_blocks(self, count, num_stats=NUM_STATS):
+        """count characters' stats as a list of lists."""
+        data = self.three_d6_stream.take(count * num_stats)
+        return [list(data[i:i + num_stats]) for i in range(0, len(data), num_stats)]
+
+
+def chi_square_3d6(totals):
+    """Pearson chi-square statistic of observed 3d6 totals against the exact
+    distribution (15 degrees of freedom)."""
+    counts = [0] * 19
+    for total in totals:
+        counts[total] += 1
+    n = sum(counts)
+    return sum((counts[total] - n * p) ** 2 / (n * p) for total, p in THREE_D6_PROBABILITIES.items())
+
+
+def randrange_3d6(count, rng=random):
+    """3d6 totals rolled the way the dnd scripts used to."""
+    return [rng.randrange(1,7) + rng.randrange(1,7) + rng.randrange(1,7) for i in range(count)]
+
+
+if __name__ == "__main__":
+    import time
+
+    samples = 1_000_000
+    dice = Dice(seed=1)
+    start = time.perf_counter()
+    totals = dice.three_d6(samples)
+    elapsed = time.perf_counter() - start
+    print(f"Dice: {samples} 3d6 in {elapsed:.3f}s, chi-square {chi_square_3d6(totals):.2f}")
+
+    start = time.perf_counter()
+    reference = randrange_3d6(samples, random.Random(1))
+    elapsed = time.perf_counter() - start
+    print(f"randrange: {samples} 3d6 in {elapsed:.3f}s, chi-square {chi_square_3d6(reference):.2f}")
+
+    for name, rolls in (("Dice", totals), ("randrange", reference)):
+        statistic = chi_square_3d6(rolls)
+        assert statistic < CHI_SQUARE_CRITICAL, f"{name} 3d6 distribution off: chi-square {statistic:.2f}"
+
+    d6_counts = [dice.d6(samples).count(face) for face in range(1, 7)]
+    print("d6 faces:", d6_counts)
+
+    # substreams are reproducible and independent of the parent's state
+    assert Dice(7).substream(3).stat_blocks(5) == Dice(7).substream(3).stat_blocks(5)
+    assert Dice(7).substream(3).stat_blocks(5) != Dice(7).substream(4).stat_blocks(5)
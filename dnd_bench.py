@@ -0,0 +1,171 @@
+# Benchmark the dnd find_top_characters variants across population and
+# top-N sizes.
+#
+#   python dnd_bench.py --sizes 10000 100000 --top 10 100 --output bench.json
+#   python dnd_bench.py --baseline bench.json      # flag regressions
+#
+# Every variant is run with the same fixed-seed Dice stream. Wall time and
+# characters/sec are the best of --repeat untraced runs; peak memory comes
+# from one more run under tracemalloc (skip it with --no-memory). Every run
+# starts with cold weight caches, so the dnd_char_no_ties_steph variants do
+# not warm each other or their own later repeats, and characters/sec counts
+# the characters each variant actually rolls.
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from dice import Dice
+import dnd_char
+import dnd_char_by_class
+import dnd_char_no_ties
+import dnd_char_no_ties_steph
+
+POPULATION_SIZES = [10_000, 100_000]
+TOP_SIZES = [10, 100]
+SEED = 1
+THRESHOLD = 0.10
+REPEAT = 3
+
+VARIANTS = {
+    "dict_of_sets": lambda num_total, num_to_find, seed:
+        dnd_char.find_top_characters(num_total, num_to_find, dice=Dice(seed)),
+    "heapreplace": lambda num_total, num_to_find, seed:
+        dnd_char_no_ties.find_top_characters(num_total, num_to_find, dice=Dice(seed)),
+    "container_heap": lambda num_total, num_to_find, seed:
+        dnd_char_no_ties_steph.find_top_characters(num_total, num_to_find, use_buckets=False, dice=Dice(seed)),
+    "bucket_heap": lambda num_total, num_to_find, seed:
+        dnd_char_no_ties_steph.find_top_characters(num_total, num_to_find, use_buckets=True, dice=Dice(seed)),
+    "per_class_heaps": lambda num_total, num_to_find, seed:
+        dnd_char_by_class.find_top_characters(num_total, num_to_find, workers=1, seed=seed),
+}
+if dnd_char.np is not None:
+    VARIANTS["dict_of_sets_numpy"] = lambda num_total, num_to_find, seed: \
+        dnd_char.find_top_characters(num_total, num_to_find, vectorized=True, seed=seed)
+# characters a variant rolls: num_total + 1, except for dnd_char_no_ties_steph
+ROLLED = {name: (lambda num_total: num_total + 1) for name in VARIANTS}
+ROLLED["container_heap"] = ROLLED["bucket_heap"] = lambda num_total: num_total
+
+
+def run_variant(func, num_total, num_to_find, seed, measure_memory=True, repeat=REPEAT, rolled=None):
+    """Best wall time, characters/sec and peak memory of func; rolled is the
+    number of characters it rolls (num_total if not given)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        walls = []
+        for i in range(repeat):
+            dnd_char_no_ties_steph.clear_weight_caches()
+            start = time.perf_counter()
+            func(num_total, num_to_find, seed)
+            walls.append(time.perf_counter() - start)
+        wall = min(walls)
+
+        peak = None
+        if measure_memory:
+            dnd_char_no_ties_steph.clear_weight_caches()
+            tracemalloc.start()
+            try:
+                func(num_total, num_to_find, seed)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "wall_time": wall,
+        "chars_per_sec": (num_total if rolled is None else rolled) / wall if wall else None,
+        "peak_memory": peak,
+    }
+
+
+def run_benchmarks(variants, sizes, tops, seed=SEED, measure_memory=True, repeat=REPEAT, progress=None):
+    results = []
+    for name in variants:
+        for num_total in sizes:
+            for num_to_find in tops:
+                result = {"variant": name, "population": num_total, "top_n": num_to_find, "seed": seed}
+                result.update(run_variant(VARIANTS[name], num_total, num_to_find, seed, measure_memory, repeat,
+                                          ROLLED[name](num_total)))
+                results.append(result)
+                if progress:
+                    progress(result)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def result_key(result):
+    return result["variant"], result["population"], result["top_n"]
+
+
+def format_row(result):
+    peak = result["peak_memory"]
+    peak = f"{peak / 2**20:9.2f}" if peak is not None else f"{'-':>9}"
+    return (f"{result['variant']:<20} {result['population']:>11,} {result['top_n']:>6} "
+            f"{result['wall_time']:9.3f} {result['chars_per_sec']:13,.0f} {peak}")
+
+
+def format_table(report):
+    header = f"{'variant':<20} {'population':>11} {'top_n':>6} {'wall (s)':>9} {'chars/sec':>13} {'peak MB':>9}"
+    return "\n".join([header, "-" * len(header)] + [format_row(r) for r in report["results"]])
+
+
+def compare(report, baseline, threshold=THRESHOLD):
+    """Regressions of report against baseline: a run whose chars/sec fell, or
+    whose peak memory grew, by more than threshold (a fraction)."""
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        if old["chars_per_sec"] and result["chars_per_sec"] < old["chars_per_sec"] * (1 - threshold):
+            regressions.append((result, "chars_per_sec", old["chars_per_sec"], result["chars_per_sec"]))
+        if old["peak_memory"] and result["peak_memory"] and \
+                result["peak_memory"] > old["peak_memory"] * (1 + threshold):
+            regressions.append((result, "peak_memory", old["peak_memory"], result["peak_memory"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dnd find_top_characters variants.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=POPULATION_SIZES)
+    parser.add_argument("--top", type=int, nargs="+", default=TOP_SIZES)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per case, best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative change that counts as a regression (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.variants, args.sizes, args.top, args.seed, not args.no_memory, args.repeat,
+                            progress=lambda result: print(format_row(result), file=sys.stderr))
+    print(format_table(report))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(report, baseline, args.threshold)
+        for result, metric, old, new in regressions:
+            print(f"REGRESSION {result['variant']} population={result['population']} top_n={result['top_n']}: "
+                  f"{metric} {old:,.0f} -> {new:,.0f} ({new / old - 1:+.1%})")
+        if regressions:
+            return 1
+        print(f"no regressions above {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
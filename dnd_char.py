@@ -1,55 +1,220 @@
 import heapq
 import math
+from operator import mul
+import os
+import pickle
 import random
+import sys
+import time
 import typing
 
+from dice import Dice
+from dnd_profile import NULL_PROFILER
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 NUM_STATS = 6
 POPULATION_SIZE = 10_000_000
 NUM_TO_FIND = 10
+CHUNK_SIZE = 1_000_000
+CHECK_EVERY = 10_000            # characters rolled between clock checks
+CHECKPOINT_INTERVAL = 30.0      # seconds between checkpoints
+PROGRESS_INTERVAL = 5.0         # seconds between progress lines
+CHECKPOINT_VERSION = 1
+
+# A checkpoint is a pickled dict: the run's parameters, how many characters
+# are done, the generator state and both top-k structures. The heaps are
+# plain lists of weights; each found dict maps weight -> the stats of its
+# characters packed into one bytes object, NUM_STATS bytes per character.
+# It is written to a temporary file and renamed over the old one, so a run
+# killed mid-write still leaves the previous checkpoint.
+
+def roll_stats(dice=None):
+    """One character's stats, 3d6 each, from dice or random.randrange."""
+    if dice is not None:
+        return dice.stat_block(NUM_STATS)
+    return [random.randrange(1,7) + random.randrange(1,7) + random.randrange(1,7) for i in range(NUM_STATS)]
+
 
 class Character:
-    def __init__(self):
+    def __init__(self, dice=None):
         self.stats = []
         self.simple_weight = 0
         self.rms_weight = 0
-        self.roll()
+        self.roll(dice)
         
-    def roll(self):
-        for i in range(NUM_STATS):
-            s = random.randrange(1,7) + random.randrange(1,7) + random.randrange(1,7)
+    def roll(self, dice=None):
+        rolls = roll_stats(dice)
+        for s in rolls:
             self.stats.append(s)
             self.simple_weight += s
             self.rms_weight += s**2
         self.rms_weight = math.sqrt(self.rms_weight / NUM_STATS)
+
+    @classmethod
+    def from_stats(cls, stats):
+        """Build a character from already-rolled stats (Python ints) instead
+        of rolling."""
+        c = cls.__new__(cls)
+        c.stats = stats = list(stats)
+        c.simple_weight = sum(stats)
+        c.rms_weight = math.sqrt(sum(map(mul, stats, stats)) / NUM_STATS)
+        return c
     
     def print_stats(self, char_num):
         s = self.stats
         print(f"({char_num:3}) "
             f"Str {s[0]:2} Int {s[1]:2} Wis {s[2]:2} Dex {s[3]:2} Con {s[4]:2} Chr {s[5]:2} "
             f"Weight: {self.simple_weight/NUM_STATS:.1f} RMS: {self.rms_weight:.1f}")
-   
-def find_top_characters(num_total, num_to_find):
+
+
+def pack_found(found_chars):
+    return {weight: bytes(s for char in chars for s in char.stats) for weight, chars in found_chars.items()}
+
+
+def unpack_found(packed):
+    return {weight: [Character.from_stats(data[i:i + NUM_STATS]) for i in range(0, len(data), NUM_STATS)]
+            for weight, data in packed.items()}
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fp:
+        pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """The state saved at path, or None if there is no checkpoint yet."""
+    try:
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} has checkpoint version {state.get('version')}, expected {CHECKPOINT_VERSION}")
+    return state
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def find_top_characters(num_total, num_to_find, vectorized=False, chunk_size=CHUNK_SIZE, seed=None, dice=None,
+                        checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, progress=False, profiler=None):
+    """Roll num_total+1 characters and print the top num_to_find (with ties)
+    by simple weight and by RMS weight.
+
+    With vectorized=True the population is rolled with NumPy in chunks of
+    chunk_size as an (N, 6) array, both weights are computed for the whole
+    chunk at once, and only each chunk's top candidates (found with a
+    partition) are turned into Character objects. seed seeds the NumPy
+    generator; the report is the same as the per-object path.
+
+    Otherwise characters are rolled with dice (a dice.Dice) if given, or with
+    random.randrange.
+
+    With checkpoint (a path) the state of the run is saved there every
+    checkpoint_interval seconds and at the end, and a run started with an
+    existing checkpoint carries on from it: with the same arguments it prints
+    exactly the report of an uninterrupted run. progress=True prints
+    characters/s and the ETA to stderr as the run goes.
+
+    profiler (a dnd_profile.Profiler) times the roll, weigh, select (numpy
+    only) and heap phases and counts the fast path rejections of both heaps,
+    and reports at the end. Both paths always run each block of characters
+    phase by phase, against dnd_profile.NULL_PROFILER when profiler is None;
+    on the numpy path only each chunk's candidates reach the heaps, so only
+    they are counted as offered.
+    """
+    if vectorized and np is None:
+        raise ImportError("vectorized mode requires numpy")
+    if profiler is None:
+        profiler = NULL_PROFILER
     if num_total < num_to_find:
         num_to_find = num_total
+    total = num_total + 1
+    rng = np.random.default_rng(seed) if vectorized else None
+    rng_kind = "numpy" if vectorized else "random" if dice is None else "dice"
+    params = (num_total, num_to_find, rng_kind, chunk_size if vectorized else None)
+    done = 0
     
     # priority queues of found character weights
     pq = []
     rpq = []
-    # dict of priority -> characters at that priority
+    # dict of priority -> characters at that priority, in the order found
     found_pq = {}
     found_rpq = {}
+
+    def get_rng_state():
+        if rng_kind == "numpy":
+            return rng.bit_generator.state
+        if rng_kind == "dice":
+            return dice.getstate()
+        return random.getstate()
+
+    def set_rng_state(state):
+        if rng_kind == "numpy":
+            rng.bit_generator.state = state
+        elif rng_kind == "dice":
+            dice.setstate(state)
+        else:
+            random.setstate(state)
+
+    state = load_checkpoint(checkpoint) if checkpoint else None
+    if state is not None:
+        if state["params"] != params:
+            raise ValueError(f"{checkpoint} is from a different run: {state['params']}, not {params}")
+        done = state["done"]
+        set_rng_state(state["rng"])
+        pq, rpq = state["pq"], state["rpq"]
+        found_pq, found_rpq = unpack_found(state["found_pq"]), unpack_found(state["found_rpq"])
+
+    def save():
+        save_checkpoint(checkpoint, {
+            "version": CHECKPOINT_VERSION, "params": params, "done": done, "rng": get_rng_state(),
+            "pq": pq, "rpq": rpq, "found_pq": pack_found(found_pq), "found_rpq": pack_found(found_rpq)})
+
+    start_time = time.perf_counter()
+    start_done = done
+    next_progress = start_time + PROGRESS_INTERVAL
+    next_checkpoint = start_time + checkpoint_interval
+    checkpoint_time = 0.0
+
+    def report_progress(now):
+        rate = (done - start_done) / (now - start_time) if now > start_time else 0.0
+        eta = format_seconds((total - done) / rate) if rate else "?"
+        overhead = f", checkpoints {checkpoint_time / (now - start_time):.2%} of the time" if checkpoint else ""
+        print(f"{done:,}/{total:,} characters ({done / total:.1%}), {rate:,.0f}/s, ETA {eta}{overhead}",
+              file=sys.stderr)
+
+    def tick():
+        # called between blocks of characters, never inside one
+        nonlocal next_progress, next_checkpoint, checkpoint_time
+        now = time.perf_counter()
+        if checkpoint and now >= next_checkpoint:
+            save()
+            checkpoint_time += time.perf_counter() - now
+            next_checkpoint = now + checkpoint_interval
+        if progress and now >= next_progress:
+            report_progress(now)
+            next_progress = now + PROGRESS_INTERVAL
     
     def add_character(char, weight, found_chars, pq):
         
         if len(pq) == num_to_find and weight < pq[0]:
-            return  #optimization
+            return True  #optimization
         else:
-            char_set = found_chars.get(weight)
-            if char_set:
-                char_set.add(char)
+            chars = found_chars.get(weight)
+            if chars:
+                chars.append(char)
             else:
-                char_set = {char,}
-                found_chars[weight] = char_set
+                found_chars[weight] = [char]
                 if len(pq) < num_to_find:
                     heapq.heappush(pq, weight)
                 elif pq[0] < weight:
@@ -57,10 +222,86 @@ def find_top_characters(num_total, num_to_find):
                     found_chars.pop(removed)
     
     def create_characters():
-        for i in range(num_total+1):
-            c = Character()        
-            add_character(c, c.simple_weight, found_pq, pq)
-            add_character(c, c.rms_weight, found_rpq, rpq)
+        # one phase at a time over each block, so a profiler reads the clock
+        # three times per block; blocks end at the edges of the cProfile slice
+        nonlocal done
+        clock = profiler.clock
+        sample = profiler.sample_range() or ()
+        while done < total:
+            n = min(CHECK_EVERY, total - done)
+            for edge in sample:
+                if done < edge < done + n:
+                    n = edge - done
+            if sample and done == sample[0]:
+                profiler.start_sample(done)
+            t0 = clock()
+            rolls = [roll_stats(dice) for i in range(n)]
+            t1 = clock()
+            chars = [Character.from_stats(stats) for stats in rolls]
+            t2 = clock()
+            rejected = rms_rejected = 0
+            for c in chars:
+                if add_character(c, c.simple_weight, found_pq, pq):
+                    rejected += 1
+                if add_character(c, c.rms_weight, found_rpq, rpq):
+                    rms_rejected += 1
+            t3 = clock()
+            done += n
+            profiler.add("roll", t1 - t0, n)
+            profiler.add("weigh", t2 - t1, n)
+            profiler.add("heap", t3 - t2, n)
+            profiler.heap("simple", n, rejected)
+            profiler.heap("rms", n, rms_rejected)
+            if sample and done == sample[1]:
+                profiler.stop_sample(done)
+            tick()
+
+    def chunk_candidates(weights, pq):
+        # everything at or above the num_to_find-th largest weight, ties included
+        k = min(num_to_find, len(weights))
+        kth = len(weights) - k
+        threshold = np.partition(weights, kth)[kth]
+        if len(pq) == num_to_find and threshold < pq[0]:
+            threshold = pq[0]
+        return np.flatnonzero(weights >= threshold)
+
+    def create_characters_vectorized():
+        nonlocal done
+        clock = profiler.clock
+        sample = profiler.sample_range()
+        while done < total:
+            n = min(chunk_size, total - done)
+            if sample and done <= sample[0] < done + n:
+                profiler.start_sample(done)
+            t0 = clock()
+            dice = rng.integers(1, 7, size=(n, NUM_STATS, 3), dtype=np.int8)
+            stats = dice.sum(axis=2, dtype=np.int8)
+            t1 = clock()
+            simple_weights = stats.sum(axis=1, dtype=np.int16)
+            squares = stats.astype(np.int16) ** 2
+            rms_weights = np.sqrt(squares.sum(axis=1, dtype=np.int32) / NUM_STATS)
+            t2 = clock()
+
+            winners = np.union1d(chunk_candidates(simple_weights, pq),
+                                 chunk_candidates(rms_weights, rpq))
+            t3 = clock()
+            rejected = rms_rejected = 0
+            for row in stats[winners].tolist():
+                c = Character.from_stats(row)
+                if add_character(c, c.simple_weight, found_pq, pq):
+                    rejected += 1
+                if add_character(c, c.rms_weight, found_rpq, rpq):
+                    rms_rejected += 1
+            done += n
+            profiler.add("roll", t1 - t0, n)
+            profiler.add("weigh", t2 - t1, n)
+            profiler.add("select", t3 - t2, n)
+            profiler.add("heap", clock() - t3, len(winners))
+            profiler.heap("simple", len(winners), rejected)
+            profiler.heap("rms", len(winners), rms_rejected)
+            if sample and done >= sample[1]:
+                profiler.stop_sample(done)
+            tick()
     
     def print_characters(pq, found_chars, label):
         pq.sort()
@@ -75,12 +316,22 @@ def find_top_characters(num_total, num_to_find):
             if num_printed >= num_to_find:
                 break
                     
-    create_characters()
+    if vectorized:
+        create_characters_vectorized()
+    else:
+        create_characters()
+    if checkpoint:
+        save()
+    if progress:
+        report_progress(time.perf_counter())
     print_characters(pq, found_pq, "Top characters by simple weight:")
     print_characters(rpq, found_rpq, "Top RMS characters:")
+    profiler.stop_sample(done)
+    profiler.report()
 
         
 if __name__ == "__main__":
-    find_top_characters(num_total=POPULATION_SIZE, num_to_find=NUM_TO_FIND)
+    find_top_characters(num_total=POPULATION_SIZE, num_to_find=NUM_TO_FIND,
+                        vectorized=np is not None, dice=Dice(), progress=True)
     
     
\ No newline at end of file
@@ -1,18 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 import heapq
+import itertools
 import math
+from operator import ge, mul
+import os
 import random
 import typing
 
+from dice import Dice
+from dnd_profile import NULL_PROFILER, Profiler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 NUM_STATS = 6
 POPULATION_SIZE = 1_000_000
 NUM_TO_FIND = 10
+BLOCK_SIZE = 100_000
+ROLL_BLOCK = 10_000             # characters rolled, weighed and offered phase by phase
 
 class CharacterClass:
     def __init__(self, name, weight_multipliers):
         self.name = name
         self.weight_multipliers = weight_multipliers
-        self.priority_queue = []
         
 classes = [
     CharacterClass("Cleric",	    [ 3,  3,  9,  3,  3,  3]),
@@ -28,15 +41,28 @@ classes = [
     CharacterClass("Bard",	        [15, 12, 15, 15, 10, 15]),
 ]
     
+def roll_stats(rng=random):
+    """One character's stats, 3d6 each, from a Dice or a random.Random-like
+    generator."""
+    if isinstance(rng, Dice):
+        return rng.stat_block(NUM_STATS)
+    return [rng.randrange(1,7) + rng.randrange(1,7) + rng.randrange(1,7) for i in range(NUM_STATS)]
+
+
 class Character:
-    def __init__(self):
+    def __init__(self, rng=random):
         self.stats = []
-        self.roll()
+        self.roll(rng)
         
-    def roll(self):
-        for i in range(NUM_STATS):
-            s = random.randrange(1,7) + random.randrange(1,7) + random.randrange(1,7)
-            self.stats.append(s)
+    def roll(self, rng=random):
+        self.stats.extend(roll_stats(rng))
+
+    @classmethod
+    def from_stats(cls, stats):
+        """Build a character from already-rolled stats instead of rolling."""
+        c = cls.__new__(cls)
+        c.stats = [int(s) for s in stats]
+        return c
     
     def print_stats(self):
         s = self.stats
@@ -45,43 +71,220 @@ class Character:
 
 @dataclass(order=True)
 class WeightedCharacter:
-    priority: int
+    # (weight, -character index): equal weights rank the earlier character higher
+    priority: tuple
     character: Character=field(compare=False)
     
     def __init__(self, priority, character):
         self.priority = priority
         self.character = character
 
-   
-def find_top_characters(num_total, num_to_find):
+
+def top_by_class(rng, start, count, num_to_find, profiler=NULL_PROFILER):
+    """Roll count characters numbered from start with rng (a Dice or a
+    random.Random-like generator) and return one
+    top-num_to_find heap of WeightedCharacters per entry in classes, and the
+    number of characters eligible for each class.
+
+    Characters are rolled, weighed against every class and offered to the
+    heaps one phase at a time over blocks of ROLL_BLOCK, and only those that
+    make it into a heap become Character objects. profiler times the
+    phases and counts each class heap's fast path rejections."""
+    pqs = [[] for char_class in classes]
+    eligible = [0] * len(classes)
+    clock = profiler.clock
+    sample = profiler.sample_range() or ()
+    done, stop = start, start + count
+    while done < stop:
+        n = min(ROLL_BLOCK, stop - done)
+        for edge in sample:
+            if done < edge < done + n:
+                n = edge - done
+        if sample and done <= sample[0] < done + n:
+            profiler.start_sample(done)
+        t0 = clock()
+        rolls = [roll_stats(rng) for i in range(n)]
+        t1 = clock()
+        # each weight multiplier is also the minimum for its stat
+        columns = [[sum(map(mul, stats, wm)) if all(map(ge, stats, wm)) else None for stats in rolls]
+                   for wm in (char_class.weight_multipliers for char_class in classes)]
+        t2 = clock()
+        for k, (pq, column) in enumerate(zip(pqs, columns)):
+            offered = rejected = 0
+            for row, weight in enumerate(column):
+                if weight is None:
+                    continue
+                offered += 1
+                priority = (weight, -(done + row))
+                if len(pq) < num_to_find:
+                    heapq.heappush(pq, WeightedCharacter(priority, Character.from_stats(rolls[row])))
+                elif priority > pq[0].priority:
+                    heapq.heapreplace(pq, WeightedCharacter(priority, Character.from_stats(rolls[row])))
+                else:
+                    rejected += 1
+            eligible[k] += offered
+            profiler.heap(classes[k].name, offered, rejected)
+        t3 = clock()
+        done += n
+        profiler.add("roll", t1 - t0, n)
+        profiler.add("weigh", t2 - t1, n)
+        profiler.add("heap", t3 - t2, n)
+        if sample and done == sample[1]:
+            profiler.stop_sample(done)
+    profiler.stop_sample(done)
+    return pqs, eligible
+
+
+def score_block(stats):
+    """Score an (N, NUM_STATS) block of characters against every class at once.
+
+    Each weight multiplier is also the minimum for its stat, so the
+    eligibility mask is stats >= multipliers for all six stats, and the
+    weights are the stats times the multiplier matrix. Returns the (N, classes)
+    mask and the (N, classes) scores, with -1 where a character is ineligible.
+    """
+    multipliers = np.array([c.weight_multipliers for c in classes], dtype=np.int16)
+    eligible = (stats[:, np.newaxis, :] >= multipliers).all(axis=2)
+    scores = stats.astype(np.int32) @ multipliers.T.astype(np.int32)
+    scores[~eligible] = -1
+    return eligible, scores
+
+
+def top_by_class_batched(rng, start, count, num_to_find, block_size=BLOCK_SIZE, profiler=NULL_PROFILER):
+    """Same result shape as top_by_class, but rolls and scores blocks of
+    characters with NumPy; rng is a numpy Generator.
+
+    Per-class candidates are picked from each block's masked scores with a
+    partition, and only they become Characters and go through the heaps, so
+    only they are counted as offered to the profiler.
+    """
+    pqs = [[] for char_class in classes]
+    eligible = [0] * len(classes)
+    clock = profiler.clock
+    sample = profiler.sample_range()
+    for block_start in range(start, start + count, block_size):
+        n = min(block_size, start + count - block_start)
+        if sample and block_start <= sample[0] < block_start + n:
+            profiler.start_sample(block_start)
+        t0 = clock()
+        dice = rng.integers(1, 7, size=(n, NUM_STATS, 3), dtype=np.int8)
+        stats = dice.sum(axis=2, dtype=np.int8)
+        t1 = clock()
+        mask, scores = score_block(stats)
+        t2 = clock()
+        selecting = 0.0
+        for k, pq in enumerate(pqs):
+            t3 = clock()
+            eligible[k] += int(np.count_nonzero(mask[:, k]))
+            column = scores[:, k]
+            candidates = np.flatnonzero(mask[:, k])
+            if len(candidates) > num_to_find:
+                # keep everything tied with the num_to_find-th best score
+                kth = len(candidates) - num_to_find
+                threshold = np.partition(column[candidates], kth)[kth]
+                candidates = candidates[column[candidates] >= threshold]
+            selecting += clock() - t3
+            rejected = 0
+            for row in candidates:
+                priority = (int(column[row]), -(block_start + int(row)))
+                if len(pq) < num_to_find:
+                    heapq.heappush(pq, WeightedCharacter(priority, Character.from_stats(stats[row])))
+                elif priority > pq[0].priority:
+                    heapq.heapreplace(pq, WeightedCharacter(priority, Character.from_stats(stats[row])))
+                else:
+                    rejected += 1
+            profiler.heap(classes[k].name, len(candidates), rejected)
+        heaping = clock() - t2 - selecting
+        profiler.add("roll", t1 - t0, n)
+        profiler.add("weigh", t2 - t1, n)
+        profiler.add("select", selecting, n)
+        profiler.add("heap", heaping, n)
+        if sample and block_start + n >= sample[1]:
+            profiler.stop_sample(block_start + n)
+    profiler.stop_sample(start + count)
+    return pqs, eligible
+
+
+def _top_by_class_shard(seed, shard, start, count, num_to_find, batched, profiler=NULL_PROFILER):
+    # every shard gets its own stream, derived only from the seed and shard number
+    if batched:
+        rng = np.random.default_rng([seed, shard])
+        return top_by_class_batched(rng, start, count, num_to_find, profiler=profiler)
+    return top_by_class(Dice(seed).substream(shard), start, count, num_to_find, profiler=profiler)
+
+
+def _profiled_shard(seed, shard, start, count, num_to_find, batched, cprofile_path, cprofile_slice):
+    # a worker process profiles into its own Profiler and sends it back
+    profiler = Profiler(cprofile_path=cprofile_path, cprofile_slice=cprofile_slice)
+    return _top_by_class_shard(seed, shard, start, count, num_to_find, batched, profiler), profiler
+
+
+def find_top_characters(num_total, num_to_find, workers=1, seed=None, batched=False, profiler=None):
+    """Find and print the top num_to_find characters for every class.
+
+    With workers > 1 the population is split into one shard per worker and
+    rolled on a process pool. Each shard rolls with its own Dice substream,
+    seeded only from (seed, shard), and keeps its own per-class top-k; the
+    shards are then merged by (weight, character index), so the result is
+    reproducible for a given seed and worker count. A single worker runs in
+    this process; without a seed a random one is picked.
+
+    With batched=True characters are rolled and scored in NumPy blocks (see
+    top_by_class_batched); the ranking rules are the same but the random
+    streams differ from the per-character path.
+
+    profiler (a dnd_profile.Profiler) times the roll, weigh, select
+    (batched only) and heap phases and counts every class heap's fast path
+    rejections, and reports at the end. Worker processes profile into their
+    own Profiler, which is merged into profiler when the shards are done.
+
+    The header of each class shows the fraction of characters eligible for it.
+    Returns a dict of class name -> WeightedCharacters, lowest first.
+    """
+    if batched and np is None:
+        raise ImportError("batched mode requires numpy")
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, not {workers}")
     if num_total < num_to_find:
         num_to_find = num_total
     
-    for i in range(num_total+1):
-        c = Character()
-        for char_class in classes:
-            pq = char_class.priority_queue
-            wm = char_class.weight_multipliers
-            weight = 0
-            for j in range(NUM_STATS):
-                if c.stats[j] < wm[j]:
-                    break
-                weight += c.stats[j] * wm[j]
-                if j == NUM_STATS-1:
-                    if len(pq) < num_to_find:
-                        heapq.heappush(pq, (WeightedCharacter(weight, c)))
-                    elif weight > pq[0].priority:
-                        heapq.heapreplace(pq, WeightedCharacter(weight, c))
+    population = num_total + 1
+    if seed is None:
+        seed = random.randrange(2**64)
+    if workers == 1:
+        shard_results = [_top_by_class_shard(seed, 0, 0, population, num_to_find, batched,
+                                             profiler if profiler is not None else NULL_PROFILER)]
+    else:
+        base, extra = divmod(population, workers)
+        counts = [base + (shard < extra) for shard in range(workers)]
+        starts = list(itertools.accumulate(counts, initial=0))[:-1]
+        args = (itertools.repeat(seed), range(workers), starts, counts,
+                itertools.repeat(num_to_find), itertools.repeat(batched))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if profiler is None:
+                shard_results = list(pool.map(_top_by_class_shard, *args))
+            else:
+                shard_results = []
+                for result, shard_profiler in pool.map(_profiled_shard, *args,
+                                                       itertools.repeat(profiler.cprofile_path),
+                                                       itertools.repeat(profiler.cprofile_slice)):
+                    shard_results.append(result)
+                    profiler.merge(shard_profiler)
     
-    for char_class in classes:
-        pq = char_class.priority_queue
-        pq.sort()
+    rankings = {}
+    for k, char_class in enumerate(classes):
+        pq = heapq.nlargest(num_to_find, itertools.chain.from_iterable(pqs[k] for pqs, _ in shard_results))
+        pq.reverse()
+        rankings[char_class.name] = pq
+        eligible = sum(class_counts[k] for _, class_counts in shard_results)
     
-        print("\n", char_class.name, char_class.weight_multipliers)
+        print("\n", char_class.name, char_class.weight_multipliers, f"eligible: {eligible / population:.4%}")
         for item in pq:
             item.character.print_stats()
+    if profiler is not None:
+        profiler.report()
+    return rankings
         
 if __name__ == "__main__":
-    find_top_characters(num_total=POPULATION_SIZE,num_to_find=NUM_TO_FIND)
-    
-    
\ No newline at end of file
+    find_top_characters(num_total=POPULATION_SIZE,num_to_find=NUM_TO_FIND, workers=os.cpu_count(),
+                        batched=np is not None)
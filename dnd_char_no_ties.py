@@ -1,29 +1,49 @@
 from dataclasses import dataclass, field
 import heapq
 import math
+from operator import mul
 import random
 import typing
 
+from dice import Dice
+from dnd_profile import NULL_PROFILER
+
 NUM_STATS = 6
 POPULATION_SIZE = 10_000
 NUM_TO_FIND = 10
+BLOCK_SIZE = 10_000             # characters rolled, weighed and offered phase by phase
+
+
+def roll_stats(dice=None):
+    """One character's stats, 3d6 each, from dice or random.randrange."""
+    if dice is not None:
+        return dice.stat_block(NUM_STATS)
+    return [random.randrange(1,7) + random.randrange(1,7) + random.randrange(1,7) for i in range(NUM_STATS)]
 
 
 class Character:
-    def __init__(self):
+    def __init__(self, dice=None):
         self.stats = []
         self.simple_weight = 0
         self.rms_weight = 0
-        self.roll()
+        self.roll(dice)
         
-    def roll(self):
-
-        for i in range(NUM_STATS):
-            s = random.randrange(1,7) + random.randrange(1,7) + random.randrange(1,7)
+    def roll(self, dice=None):
+        rolls = roll_stats(dice)
+        for s in rolls:
             self.stats.append(s)
             self.simple_weight += s
             self.rms_weight += s**2
         self.rms_weight = math.sqrt(self.rms_weight / 6)
+
+    @classmethod
+    def from_stats(cls, stats):
+        """Build a character from already-rolled stats instead of rolling."""
+        c = cls.__new__(cls)
+        c.stats = stats = list(stats)
+        c.simple_weight = sum(stats)
+        c.rms_weight = math.sqrt(sum(map(mul, stats, stats)) / 6)
+        return c
     
     def print_stats(self):
         s = self.stats
@@ -49,25 +69,73 @@ class RMSWeightedCharacter:
         self.priority = character.rms_weight
 
    
-def find_top_characters(num_total, num_to_find):
+def find_top_characters(num_total, num_to_find, dice=None, profiler=None):
+    """Roll num_total+1 characters and print the top num_to_find + 1 by
+    simple weight and by RMS weight.
+
+    After the heaps are filled the rest is rolled, weighed and offered to
+    the heaps one phase at a time over blocks of BLOCK_SIZE characters.
+    profiler (a dnd_profile.Profiler) times the roll, weigh and heap phases
+    of those blocks, counts how often the "weight <= minimum" fast path
+    turns a character away, and reports at the end; without one the same
+    loop runs against dnd_profile.NULL_PROFILER.
+    """
     if num_total < num_to_find:
         num_to_find = num_total
+    if profiler is None:
+        profiler = NULL_PROFILER
     
     pq = []
     rpq = []
     for i in range(num_to_find+1):
-        c = Character()
+        c = Character(dice)
         pq.append(SimpleWeightedCharacter(c))
         rpq.append(RMSWeightedCharacter(c))
     heapq.heapify(pq)
     heapq.heapify(rpq)
     
-    for i in range(num_total - num_to_find):
-        c = Character()
-        if c.simple_weight > pq[0].priority:
-            heapq.heapreplace(pq, SimpleWeightedCharacter(c))
-        if c.rms_weight > rpq[0].priority:
-            heapq.heapreplace(rpq, RMSWeightedCharacter(c))
+    clock = profiler.clock
+    done = num_to_find + 1
+    total = num_total + 1
+    # blocks end at the edges of the cProfile slice, which cannot start
+    # among the characters that filled the heaps
+    sample = tuple(max(edge, done) for edge in profiler.sample_range() or ())
+    while done < total:
+        n = min(BLOCK_SIZE, total - done)
+        for edge in sample:
+            if done < edge < done + n:
+                n = edge - done
+        if sample and done == sample[0]:
+            profiler.start_sample(done)
+        t0 = clock()
+        rolls = [roll_stats(dice) for i in range(n)]
+        t1 = clock()
+        simple_weights = list(map(sum, rolls))
+        rms_weights = [math.sqrt(sum(map(mul, stats, stats)) / 6) for stats in rolls]
+        t2 = clock()
+        # only characters that make it into a heap become Character objects
+        rejected = rms_rejected = 0
+        for stats, simple_weight, rms_weight in zip(rolls, simple_weights, rms_weights):
+            c = None
+            if simple_weight > pq[0].priority:
+                c = Character.from_stats(stats)
+                heapq.heapreplace(pq, SimpleWeightedCharacter(c))
+            else:
+                rejected += 1
+            if rms_weight > rpq[0].priority:
+                c = c or Character.from_stats(stats)
+                heapq.heapreplace(rpq, RMSWeightedCharacter(c))
+            else:
+                rms_rejected += 1
+        t3 = clock()
+        done += n
+        profiler.add("roll", t1 - t0, n)
+        profiler.add("weigh", t2 - t1, n)
+        profiler.add("heap", t3 - t2, n)
+        profiler.heap("simple", n, rejected)
+        profiler.heap("rms", n, rms_rejected)
+        if sample and done == sample[1]:
+            profiler.stop_sample(done)
     
     pq.sort()
     rpq.sort()
@@ -78,8 +146,10 @@ def find_top_characters(num_total, num_to_find):
     print("Top RMS characters:")
     for item in rpq:
         item.character.print_stats()
+    profiler.stop_sample(done)
+    profiler.report()
         
 if __name__ == "__main__":
-    find_top_characters(num_total=POPULATION_SIZE,num_to_find=NUM_TO_FIND)
+    find_top_characters(num_total=POPULATION_SIZE,num_to_find=NUM_TO_FIND, dice=Dice())
     
     
\ No newline at end of file
@@ -1,39 +1,178 @@
+from collections import OrderedDict, namedtuple
 from dataclasses import dataclass, field
 from functools import reduce
 from heapq import heapify, heappop, heappush, nsmallest
 from math import sqrt, trunc
 from random import randrange
 
+from dice import Dice
+
 MAX_NUMBER = float("inf")
 NUM_PLAYERS = 100000
 TOP_N = 10
+BATCH_SIZE = 10000
+WEIGHT_CACHE_SIZE = 1 << 16    # above the 54,264 multisets of six 3d6 stats
 
 STAT_NAMES = [ "Str", "Int", "Wis", "Dex", "Con", "Chr" ]
 NUM_STATS = len(STAT_NAMES)
 
-WEIGHTING = {
-    "sum": sum,
-    "RMS": lambda scores : trunc(sqrt(reduce((lambda a,b : a + b*b),scores,0)/len(scores)))
-}
+
+# a multiset of stats in 3..18 packs into one int, 3 bits of count per value
+STAT_KEY = { s: 1 << (3 * (s - 3)) for s in range(3, 19) }
+
+def multiset_key(stats):
+    """Canonical key for the multiset of stats: the packed int when every stat
+    is in 3..18 and there are at most 7 of them, otherwise the sorted tuple."""
+    if len(stats) < 8:
+        try:
+            return sum([STAT_KEY[s] for s in stats])
+        except KeyError:
+            pass
+    return tuple(sorted(stats))
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+MISSING = object()
+
+
+class WeightCache:
+    """Bounded LRU memo with hit/miss counters: a hit moves its entry to the
+    end, and when full the least recently used entry is evicted."""
+    def __init__(self, maxsize=WEIGHT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """The cached value of key, counted as a hit, or MISSING."""
+        value = self.entries.get(key, MISSING)
+        if value is not MISSING:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def add(self, key, value):
+        self.misses += 1
+        if len(self.entries) >= self.maxsize:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+
+class Weighting:
+    """A weight function of a stats list, declared permutation-invariant (it
+    depends only on the multiset of stats) or not.
+
+    Calling it directly goes through its own bounded cache, keyed on
+    multiset_key() for invariant functions and on the stats tuple otherwise.
+    """
+    def __init__(self, func, permutation_invariant=True, maxsize=WEIGHT_CACHE_SIZE):
+        self.func = func
+        self.permutation_invariant = permutation_invariant
+        self.cache = WeightCache(maxsize)
+
+    def __call__(self, stats):
+        key = multiset_key(stats) if self.permutation_invariant else tuple(stats)
+        weight = self.cache.get(key)
+        if weight is MISSING:
+            return self.cache.add(key, self.func(stats))
+        return weight
+
+    def cache_info(self):
+        return self.cache.cache_info()
+
+
+# name -> Weighting, and the inclusive range of a weighting's values for BucketHeap
+WEIGHTING = {}
+WEIGHT_BOUNDS = {}
+VARIANT_WEIGHTINGS = {}
+# multiset key -> dict of every permutation-invariant weight; there are
+# 54,264 distinct multisets of six 3d6 stats (C(21, 6)), which all fit in
+# WEIGHT_CACHE_SIZE, so at NUM_PLAYERS scale this mostly hits
+INVARIANT_WEIGHTS = WeightCache()
+
+def register_weighting(name, func, permutation_invariant=True, bounds=None, maxsize=WEIGHT_CACHE_SIZE):
+    WEIGHTING[name] = Weighting(func, permutation_invariant, maxsize)
+    VARIANT_WEIGHTINGS.pop(name, None)
+    if not permutation_invariant:
+        VARIANT_WEIGHTINGS[name] = WEIGHTING[name]
+    if bounds is not None:
+        WEIGHT_BOUNDS[name] = bounds
+    else:
+        WEIGHT_BOUNDS.pop(name, None)
+    INVARIANT_WEIGHTS.clear()
+
+def weigh(stats, key=None):
+    """All registered weights of stats. key is multiset_key(stats) if the
+    caller already has it. The returned dict may be shared between characters
+    and must not be modified."""
+    if key is None:
+        key = multiset_key(stats)
+    # WeightCache.get, inlined for the per-character hot path
+    entries = INVARIANT_WEIGHTS.entries
+    weights = entries.get(key, MISSING)
+    if weights is MISSING:
+        weights = INVARIANT_WEIGHTS.add(key, { name: weighting.func(stats) for name, weighting in WEIGHTING.items()
+                                               if weighting.permutation_invariant })
+    else:
+        INVARIANT_WEIGHTS.hits += 1
+        entries.move_to_end(key)
+    if VARIANT_WEIGHTINGS:
+        weights = dict(weights)
+        for name, weighting in VARIANT_WEIGHTINGS.items():
+            weights[name] = weighting(stats)
+    return weights
+
+def clear_weight_caches():
+    """Empty the shared cache and every weighting's own, and zero their
+    counters, so the next run starts cold."""
+    INVARIANT_WEIGHTS.clear()
+    for weighting in WEIGHTING.values():
+        weighting.cache.clear()
+
+def weight_cache_info():
+    """Cache statistics: one entry for the shared permutation-invariant cache
+    and one per weighting that is not permutation-invariant."""
+    info = {"permutation-invariant": INVARIANT_WEIGHTS.cache_info()}
+    for name, weighting in VARIANT_WEIGHTINGS.items():
+        info[name] = weighting.cache_info()
+    return info
+
+register_weighting("sum", sum, bounds=(3 * NUM_STATS, 18 * NUM_STATS))
+register_weighting("RMS", lambda scores : trunc(sqrt(reduce((lambda a,b : a + b*b),scores,0)/len(scores))),
+                   bounds=(3, 18))
 NUM_WEIGHTS = len(WEIGHTING)
 
 
 class Character:
-    def __init__(self, id):
+    def __init__(self, id, dice=None):
         self.id = id
         self.stats = []
         self.weights = {}
-        self.__create_stats()
+        self.__create_stats(dice)
 
     @staticmethod
     def roll():
         return randrange(1, 7)
 
-    def __create_stats(self):
-        for i in range(NUM_STATS):
-            s = self.roll() + self.roll() + self.roll()
+    def __create_stats(self, dice=None):
+        if dice is not None:
+            rolls = dice.stat_block(NUM_STATS)
+        else:
+            rolls = [self.roll() + self.roll() + self.roll() for i in range(NUM_STATS)]
+        key = 0
+        for s in rolls:
             self.stats.append(s)
-        self.weights = { key: func(self.stats) for key, func in WEIGHTING.items() }
+            key += STAT_KEY[s]
+        self.weights = weigh(self.stats, key)
 
     def __str__(self):
         s = f"Character {self.id}: "
@@ -85,13 +224,16 @@ class ContainerHeap:
         self.min = self.min_container.priority
 
     def push(self, character):
+        """Add character if it makes the top heap_limit; True if it was
+        turned away by the below-minimum fast path."""
         priority = character.weights[self.weight_name]
         if priority < self.min:
-            if self.size < self.heap_limit:
-                container = self.CharacterContainer(character, self.weight_name)
-                self.push_container(container)
-                self.min = container.priority
-                self.min_container = container
+            if self.size >= self.heap_limit:
+                return True
+            container = self.CharacterContainer(character, self.weight_name)
+            self.push_container(container)
+            self.min = container.priority
+            self.min_container = container
         else:
             container = self.containers.get(priority, None)
             if container is None:
@@ -104,28 +246,174 @@ class ContainerHeap:
             if container is not self.min_container and (self.size - self.min_container.size) >= self.heap_limit:
                 self.pop_container()
 
+    def push_many(self, characters):
+        for character in characters:
+            self.push(character)
+
+    def groups(self):
+        """(priority, characters) for every kept priority, highest first."""
+        return [(container.priority, list(container.players.values()))
+                for container in sorted(self.heap, reverse=True)]
+
     def __str__(self):
         s = "\n".join([str(container) for container in self.heap])
         return f"Top {self.heap_limit} (with ties) sorted by {self.weight_name}:\n{s}\n"
 
 
+class BucketHeap:
+    """Same top-N-with-ties contract as ContainerHeap, for weightings whose
+    values are small bounded integers.
+
+    There is one bucket (a dict of id -> character) per possible weight, so a
+    push is a list index rather than heap and dict work, a character below the
+    current minimum is rejected with one comparison once the heap is full, and
+    the lowest bucket is dropped as soon as the ones above it hold heap_limit
+    characters.
+    """
+    def __init__(self, weight_name, heap_limit=MAX_NUMBER, bounds=None):
+        self.weight_name = weight_name
+        self.heap_limit = heap_limit
+        self.low, self.high = bounds if bounds is not None else WEIGHT_BOUNDS[weight_name]
+        self.buckets = [None] * (self.high - self.low + 1)
+        self.min = MAX_NUMBER
+        self.size = 0
+
+    def push(self, character):
+        priority = character.weights[self.weight_name]
+        if priority < self.min and self.size >= self.heap_limit:
+            return True
+
+        # check the weight before touching any state
+        index = priority - self.low
+        if not 0 <= index < len(self.buckets):
+            raise ValueError(f"{self.weight_name} weight {priority} outside {self.low}..{self.high}")
+        if priority < self.min:
+            self.min = priority
+        bucket = self.buckets[index]
+        if bucket is None:
+            self.buckets[index] = {character.id: character}
+        else:
+            bucket[character.id] = character
+        self.size += 1
+
+        if priority != self.min:
+            min_index = self.min - self.low
+            min_bucket = self.buckets[min_index]
+            if self.size - len(min_bucket) >= self.heap_limit:
+                self.buckets[min_index] = None
+                self.size -= len(min_bucket)
+                min_index += 1
+                while self.buckets[min_index] is None:
+                    min_index += 1
+                self.min = min_index + self.low
+
+    def push_many(self, characters):
+        """push() every character, doing the below-threshold rejection inline."""
+        weight_name = self.weight_name
+        push = self.push
+        # once the heap is full it stays full, and only push() can raise the minimum
+        threshold = self.min if self.size >= self.heap_limit else -MAX_NUMBER
+        for character in characters:
+            if character.weights[weight_name] >= threshold:
+                push(character)
+                if self.size >= self.heap_limit:
+                    threshold = self.min
+
+    def groups(self):
+        """(priority, characters) for every kept priority, highest first."""
+        return [(index + self.low, list(bucket.values()))
+                for index, bucket in reversed(list(enumerate(self.buckets))) if bucket]
+
+    def __str__(self):
+        s = "\n".join(["\n".join([str(player) for player in bucket.values()])
+                       for bucket in self.buckets if bucket])
+        return f"Top {self.heap_limit} (with ties) sorted by {self.weight_name}:\n{s}\n"
+
+
+def make_heap(weight_name, heap_limit, use_buckets=True):
+    if use_buckets and weight_name in WEIGHT_BOUNDS:
+        return BucketHeap(weight_name, heap_limit)
+    return ContainerHeap(weight_name, heap_limit)
+
+
+def profile_batch(profiler, pqs, start, stop, dice=None):
+    """One batch of find_top_characters, timed phase by phase. The weight
+    functions run inside Character() (on weight cache misses only) and are
+    timed by their own wrappers, so that time is taken out of "roll"; the
+    weight caches' hits and misses are reported alongside, so a warm cache
+    does not pass for weighing that never ran. Each heap gets one push() per
+    character so its rejections can be counted."""
+    clock = profiler.clock
+    weight_phases = [f"weight {weight_name}" for weight_name in WEIGHTING.keys()]
+    weighing = sum(profiler.times[phase] for phase in weight_phases)
+    caches = weight_cache_info()
+    t0 = clock()
+    batch = [Character(id, dice) for id in range(start, stop)]
+    elapsed = clock() - t0
+    weighing = sum(profiler.times[phase] for phase in weight_phases) - weighing
+    profiler.add("roll", elapsed - weighing, len(batch))
+    for cache_name, info in weight_cache_info().items():
+        before = caches.get(cache_name, CacheInfo(0, 0, info.maxsize, 0))
+        profiler.cache(f"{cache_name} weights", info.hits - before.hits, info.misses - before.misses,
+                       before.currsize)
+    for weight_name, pq in pqs.items():
+        push = pq.push
+        rejected = 0
+        t0 = clock()
+        for character in batch:
+            if push(character):
+                rejected += 1
+        profiler.add(f"heap {weight_name}", clock() - t0, len(batch))
+        profiler.heap(weight_name, len(batch), rejected)
+
+
 # begin execution
-def find_top_characters(num_total, num_to_find):
+def find_top_characters(num_total, num_to_find, use_buckets=True, dice=None, profiler=None):
 
     # create and populate dict of priority queue for each type of weighting
     pqs = {}
     for weight_name in WEIGHTING.keys():
-        pqs[weight_name] = ContainerHeap(weight_name, num_to_find)
+        pqs[weight_name] = make_heap(weight_name, num_to_find, use_buckets)
 
-    # now create characters and plop into limited-size priority queues of character containers
-    for id in range(num_total):
-        character = Character(id)
-        for weight_name in WEIGHTING.keys():
-            pqs[weight_name].push(character)
+    if profiler is not None:
+        funcs = { weight_name: weighting.func for weight_name, weighting in WEIGHTING.items() }
+        for weight_name, weighting in WEIGHTING.items():
+            weighting.func = profiler.timed(f"weight {weight_name}", weighting.func)
+    try:
+        # now create characters and plop into limited-size priority queues of character containers
+        for start in range(0, num_total, BATCH_SIZE):
+            stop = min(start + BATCH_SIZE, num_total)
+            if profiler is not None:
+                sample = profiler.sample_range()
+                if sample and start <= sample[0] < stop:
+                    profiler.start_sample(start)
+                profile_batch(profiler, pqs, start, stop, dice)
+                if sample and stop >= sample[1]:
+                    profiler.stop_sample(stop)
+                continue
+            batch = [Character(id, dice) for id in range(start, stop)]
+            for weight_name in WEIGHTING.keys():
+                pqs[weight_name].push_many(batch)
+    finally:
+        if profiler is not None:
+            for weight_name, weighting in WEIGHTING.items():
+                weighting.func = funcs[weight_name]
 
     # then print the container contents
     for weight_name in WEIGHTING.keys():
         print(pqs[weight_name])
+    if profiler is not None:
+        profiler.stop_sample(num_total)
+        profiler.report()
+
+def print_cache_info():
+    for cache_name, info in weight_cache_info().items():
+        lookups = info.hits + info.misses
+        hit_rate = info.hits / lookups if lookups else 0
+        print(f"{cache_name} weight cache: {info.hits} hits, {info.misses} misses "
+              f"({hit_rate:.1%}), {info.currsize} entries")
+
 
 if __name__ == "__main__":
-    find_top_characters(NUM_PLAYERS, TOP_N)
+    find_top_characters(NUM_PLAYERS, TOP_N, dice=Dice())
+    print_cache_info()
@@ -0,0 +1,63 @@
+# Compare ContainerHeap and BucketHeap from dnd_char_no_ties_steph on the
+# same stream of characters.
+#
+#   python dnd_heap_bench.py [num_players ...]
+
+import random
+import sys
+import time
+
+from dnd_char_no_ties_steph import WEIGHTING, BucketHeap, Character, ContainerHeap, TOP_N
+
+PLAYER_COUNTS = [100_000, 10_000_000]
+BATCH_SIZE = 100_000
+SEED = 1
+
+
+def bench(num_players, num_to_find=TOP_N, seed=SEED):
+    """Push num_players characters into both heap types for every weighting
+    and return the push time (seconds) spent in each heap type.
+
+    ContainerHeap is driven one push() at a time, as find_top_characters used
+    to; BucketHeap gets each batch through push_many().
+
+    Characters are rolled in batches so the 10M case does not have to keep
+    the whole population alive; rolling time is not counted.
+    """
+    random.seed(seed)
+    heaps = {
+        heap_type: [heap_type(weight_name, num_to_find) for weight_name in WEIGHTING.keys()]
+        for heap_type in (ContainerHeap, BucketHeap)
+    }
+    times = dict.fromkeys(heaps, 0.0)
+
+    next_id = 0
+    while next_id < num_players:
+        count = min(BATCH_SIZE, num_players - next_id)
+        batch = [Character(id) for id in range(next_id, next_id + count)]
+        next_id += count
+        start = time.perf_counter()
+        for pq in heaps[ContainerHeap]:
+            push = pq.push
+            for character in batch:
+                push(character)
+        times[ContainerHeap] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for pq in heaps[BucketHeap]:
+            pq.push_many(batch)
+        times[BucketHeap] += time.perf_counter() - start
+
+    for container_pq, bucket_pq in zip(*heaps.values()):
+        assert sorted(str(container_pq).splitlines()) == sorted(str(bucket_pq).splitlines())
+    return times
+
+
+if __name__ == "__main__":
+    counts = [int(arg.replace("_", "")) for arg in sys.argv[1:]] or PLAYER_COUNTS
+    for num_players in counts:
+        times = bench(num_players)
+        container, bucket = times[ContainerHeap], times[BucketHeap]
+        print(f"{num_players:>12,} players  "
+              f"ContainerHeap {container:7.3f}s  BucketHeap {bucket:7.3f}s  "
+              f"speedup {container / bucket:.2f}x")
@@ -0,0 +1,186 @@
+# Opt-in instrumentation for the dnd find_top_characters pipelines.
+#
+#   profiler = Profiler(cprofile_path="roll.prof", cprofile_slice=(0, 10_000))
+#   dnd_char.find_top_characters(1_000_000, 10, dice=Dice(1), profiler=profiler)
+#
+# Every find_top_characters (dnd_char, dnd_char_no_ties, dnd_char_by_class
+# and dnd_char_no_ties_steph) takes profiler=None by default. The first
+# three then run their one loop against NULL_PROFILER, whose hooks do
+# nothing; dnd_char_no_ties_steph runs the code it always ran.
+# dnd_char_by_class workers profile into their own Profiler, which is
+# merged back. Given a Profiler they time each phase (rolling, weighting,
+# heap work) with perf_counter, count the characters each top-k structure
+# was offered and how many its "weight < minimum" fast path turned away,
+# the hits and misses of any weight cache (so a warm cache is not mistaken
+# for weighing that never ran), and optionally run cProfile over one slice
+# of the population. Phases are timed over whole blocks of characters, so
+# the bookkeeping is a few clock reads per block; only the steph weight
+# functions, which run on cache misses, are timed per call. The report goes
+# out at the end of find_top_characters.
+
+import cProfile
+import collections
+import json
+import sys
+import time
+
+FORMATS = ("table", "json")
+
+
+class Profiler:
+    """Phase times, call counts and heap rejections for one or more runs.
+
+    times[phase] and calls[phase] accumulate across runs, as do offered[heap]
+    and rejected[heap], and caches[name], a [hits, misses, entries] list
+    whose entries is the size of the cache when it was first reported, so a
+    cache that started warm shows up as such. With cprofile_path, characters cprofile_slice[0] up
+    to cprofile_slice[1] run under cProfile (their phase times include its
+    overhead) and the stats are dumped to cprofile_path.
+    """
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, output="table", file=None, cprofile_path=None, cprofile_slice=(0, 10_000)):
+        if output not in FORMATS:
+            raise ValueError(f"output must be one of {FORMATS}, not {output!r}")
+        self.output = output
+        self.file = file
+        self.cprofile_path = cprofile_path
+        self.cprofile_slice = cprofile_slice
+        self.cprofile = None
+        self.sampled = None
+        self.times = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.offered = collections.defaultdict(int)
+        self.rejected = collections.defaultdict(int)
+        self.caches = {}
+
+    def add(self, phase, seconds, calls=1):
+        self.times[phase] += seconds
+        self.calls[phase] += calls
+
+    def timed(self, phase, func):
+        """func, adding the time of every call to phase."""
+        clock = self.clock
+        def timed_func(*args):
+            start = clock()
+            result = func(*args)
+            self.add(phase, clock() - start)
+            return result
+        return timed_func
+
+    def heap(self, name, offered, rejected):
+        self.offered[name] += offered
+        self.rejected[name] += rejected
+
+    def cache(self, name, hits, misses, entries):
+        """hits and misses of a cache holding entries before them."""
+        counts = self.caches.setdefault(name, [0, 0, entries])
+        counts[0] += hits
+        counts[1] += misses
+
+    def sample_range(self):
+        """The character numbers to run under cProfile, or None."""
+        return self.cprofile_slice if self.cprofile_path else None
+
+    def start_sample(self, first):
+        self.cprofile = cProfile.Profile()
+        self.sampled = [first, first]
+        self.cprofile.enable()
+
+    def stop_sample(self, stop):
+        if self.cprofile is None:
+            return
+        self.cprofile.disable()
+        self.cprofile.dump_stats(self.cprofile_path)
+        self.cprofile = None
+        self.sampled[1] = stop
+
+    def merge(self, other):
+        """Add the counts of other, e.g. a Profiler sent back by a worker
+        process, to this one."""
+        for phase, seconds in other.times.items():
+            self.add(phase, seconds, other.calls[phase])
+        for name, offered in other.offered.items():
+            self.heap(name, offered, other.rejected[name])
+        for name, (hits, misses, entries) in other.caches.items():
+            self.cache(name, hits, misses, entries)
+        if other.sampled is not None:
+            self.sampled = other.sampled
+
+    def as_dict(self):
+        total = sum(self.times.values())
+        return {
+            "phases": {phase: {"seconds": seconds, "calls": self.calls[phase],
+                               "share": seconds / total if total else 0.0}
+                       for phase, seconds in self.times.items()},
+            "heaps": {name: {"offered": offered, "rejected": self.rejected[name],
+                             "rejection_rate": self.rejected[name] / offered if offered else 0.0}
+                      for name, offered in self.offered.items()},
+            "caches": {name: {"hits": hits, "misses": misses, "entries_at_start": entries,
+                              "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+                       for name, (hits, misses, entries) in self.caches.items()},
+            "cprofile": None if self.sampled is None else {"path": self.cprofile_path, "characters": self.sampled},
+        }
+
+    def format_table(self):
+        report = self.as_dict()
+        header = f"{'phase':<16} {'calls':>13} {'seconds':>9} {'us/call':>9} {'share':>7}"
+        lines = [header, "-" * len(header)]
+        for phase, row in report["phases"].items():
+            per_call = row["seconds"] / row["calls"] * 1e6 if row["calls"] else 0.0
+            lines.append(f"{phase:<16} {row['calls']:>13,} {row['seconds']:9.3f} {per_call:9.3f} {row['share']:7.1%}")
+        for name, row in report["heaps"].items():
+            lines.append(f"heap {name}: {row['offered']:,} offered, {row['rejected']:,} rejected "
+                         f"by the fast path ({row['rejection_rate']:.2%})")
+        for name, row in report["caches"].items():
+            start = f"warm, {row['entries_at_start']:,} entries" if row["entries_at_start"] else "cold"
+            lines.append(f"cache {name}: {row['hits']:,} hits, {row['misses']:,} misses "
+                         f"({row['hit_rate']:.2%} hits), started {start}")
+        if report["cprofile"]:
+            first, stop = report["cprofile"]["characters"]
+            lines.append(f"cProfile of characters {first:,}..{stop - 1:,} written to {self.cprofile_path}")
+        return "\n".join(lines)
+
+    def report(self):
+        file = self.file if self.file is not None else sys.stderr
+        if self.output == "json":
+            json.dump(self.as_dict(), file, indent=2)
+            print(file=file)
+        else:
+            print(self.format_table(), file=file)
+
+
+class NullProfiler:
+    """The Profiler hooks, doing nothing: a pipeline written against a
+    profiler runs the same loop whether profiling is on or off."""
+
+    @staticmethod
+    def clock():
+        return 0.0
+
+    def add(self, phase, seconds, calls=1):
+        pass
+
+    def timed(self, phase, func):
+        return func
+
+    def heap(self, name, offered, rejected):
+        pass
+
+    def cache(self, name, hits, misses, entries):
+        pass
+
+    def sample_range(self):
+        return None
+
+    def start_sample(self, first):
+        pass
+
+    def stop_sample(self, stop):
+        pass
+
+    def report(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
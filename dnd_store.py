@@ -0,0 +1,176 @@
+# Compact storage for very large dnd character populations.
+#
+# The dnd scripts keep every character as a Python object with a stats list
+# (and weights), which is ~500 bytes each. CharacterStore packs the six stats
+# of each character into 6 bytes of one bytearray and keeps the weights in
+# parallel typed arrays, so 10M characters take ~90 MB and can be re-ranked
+# under a new weighting without re-rolling.
+
+from array import array
+import heapq
+import itertools
+import math
+
+from dice import Dice
+
+STAT_NAMES = ["Str", "Int", "Wis", "Dex", "Con", "Chr"]
+NUM_STATS = len(STAT_NAMES)
+POPULATION_SIZE = 10_000_000
+NUM_TO_FIND = 10
+ROLL_BATCH = 100_000
+
+SQUARES = [s * s for s in range(256)]
+
+
+class CharacterView:
+    """One character of a CharacterStore, addressed by index."""
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def stats(self):
+        start = self.index * NUM_STATS
+        return list(self.store.stats[start:start + NUM_STATS])
+
+    @property
+    def simple_weight(self):
+        return self.store.simple[self.index]
+
+    @property
+    def rms_weight(self):
+        return math.sqrt(self.store.squares[self.index] / NUM_STATS)
+
+    def weight(self, name):
+        if name == "rms":
+            return self.rms_weight
+        return self.store.weight_array(name)[self.index]
+
+    def print_stats(self, char_num):
+        s = self.stats
+        print(f"({char_num:3}) "
+            f"Str {s[0]:2} Int {s[1]:2} Wis {s[2]:2} Dex {s[3]:2} Con {s[4]:2} Chr {s[5]:2} "
+            f"Weight: {self.simple_weight/NUM_STATS:.1f} RMS: {self.rms_weight:.1f}")
+
+    def __str__(self):
+        s = f"Character {self.index}: "
+        for name, value in zip(STAT_NAMES, self.stats):
+            s = f"{s}{name}: {value}  "
+        for k, weights in self.store.weights.items():
+            s = f"{s} {k} weight: {weights[self.index]:.1f}  "
+        return s
+
+
+class CharacterStore:
+    """Array-backed character population.
+
+    stats holds NUM_STATS bytes per character. simple (sum of stats, 'B')
+    and squares (sum of squared stats, 'H') are always kept; squares ranks
+    exactly like dnd_char's rms_weight, which views compute from it on demand,
+    so top("rms") ranks by the "squares" array. add_weighting() adds further
+    named weightings, each in its own array.
+    """
+    BUILTIN_WEIGHTS = ("simple", "squares", "rms")
+    # weightings ranked by a stored array that orders the same way
+    RANKED_BY = {"rms": "squares"}
+
+    def __init__(self):
+        self.stats = bytearray()
+        self.simple = array('B')
+        self.squares = array('H')
+        self.weightings = {}
+        self.weights = {}
+
+    def __len__(self):
+        return len(self.simple)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("character index out of range")
+        return CharacterView(self, index % len(self))
+
+    def append(self, stats):
+        self.extend_packed(bytes(stats))
+
+    def extend_characters(self, characters):
+        """Pack existing Character objects (anything with a stats list)."""
+        self.extend_packed(bytes(itertools.chain.from_iterable(c.stats for c in characters)))
+
+    def extend_packed(self, data):
+        """Add characters from NUM_STATS bytes each of packed stats."""
+        if len(data) % NUM_STATS:
+            raise ValueError(f"packed stats must be a multiple of {NUM_STATS} bytes")
+        rows = [data[i:i + NUM_STATS] for i in range(0, len(data), NUM_STATS)]
+        self.stats += data
+        self.simple.extend(map(sum, rows))
+        self.squares.extend(sum(map(SQUARES.__getitem__, row)) for row in rows)
+        for name, (func, typecode) in self.weightings.items():
+            self.weights[name].extend(map(func, rows))
+
+    def roll(self, count, dice=None):
+        """Roll count new characters with 3d6 per stat from dice (a fresh
+        unseeded Dice if not given)."""
+        if dice is None:
+            dice = Dice()
+        while count:
+            n = min(ROLL_BATCH, count)
+            count -= n
+            self.extend_packed(dice.three_d6(n * NUM_STATS))
+
+    def add_weighting(self, name, func, typecode='d'):
+        """Compute func(stats) for every stored character into an array of
+        typecode, and keep it up to date as characters are added."""
+        if name in self.BUILTIN_WEIGHTS:
+            raise ValueError(f"{name} is a built-in weighting")
+        stats = self.stats
+        weights = array(typecode, (func(stats[i:i + NUM_STATS])
+                                   for i in range(0, len(stats), NUM_STATS)))
+        self.weightings[name] = (func, typecode)
+        self.weights[name] = weights
+
+    def remove_weighting(self, name):
+        del self.weightings[name]
+        del self.weights[name]
+
+    def weight_array(self, name):
+        """The stored array of "simple", "squares" or an added weighting."""
+        if name == "simple":
+            return self.simple
+        if name == "squares":
+            return self.squares
+        return self.weights[name]
+
+    def top(self, num_to_find, weight_name="simple"):
+        """Views of the top num_to_find characters by weight_name, highest
+        first. Every character tied with the last one is included."""
+        weights = self.weight_array(self.RANKED_BY.get(weight_name, weight_name))
+        if not num_to_find or not weights:
+            return []
+        best = heapq.nlargest(num_to_find, range(len(weights)), key=weights.__getitem__)
+        threshold = weights[best[-1]]
+        found = [i for i, w in enumerate(weights) if w >= threshold]
+        found.sort(key=lambda i: (-weights[i], i))
+        return [CharacterView(self, i) for i in found]
+
+    def print_top(self, num_to_find, weight_name, label):
+        print(label)
+        for num_printed, char in enumerate(self.top(num_to_find, weight_name), 1):
+            char.print_stats(num_printed)
+
+    def nbytes(self):
+        arrays = [self.simple, self.squares, *self.weights.values()]
+        return len(self.stats) + sum(a.itemsize * len(a) for a in arrays)
+
+
+if __name__ == "__main__":
+    store = CharacterStore()
+    store.roll(POPULATION_SIZE)
+    print(f"{len(store):,} characters in {store.nbytes() / 2**20:.1f} MB")
+    store.print_top(NUM_TO_FIND, "simple", "Top characters by simple weight:")
+    store.print_top(NUM_TO_FIND, "rms", "Top RMS characters:")
+
+    # re-rank the same population without re-rolling
+    store.add_weighting("Str*Dex*Con", lambda s: s[0] * s[3] * s[4], 'H')
+    store.print_top(NUM_TO_FIND, "Str*Dex*Con", "Top characters by Str*Dex*Con:")
@@ -0,0 +1,121 @@
+# Running top-N (with ties) over an unbounded feed of characters.
+#
+# TopCharacterStream keeps one dnd_char_no_ties_steph heap per weighting and
+# can be fed from an iterator (usually on its own thread) or from an async
+# iterator / asyncio.Queue, while snapshot() returns the current leaders at
+# any time. Characters are pushed in batches under a lock, so a snapshot
+# always sees whole batches, and costs O(N) in the size of the kept leaders,
+# not in the number of characters consumed.
+
+import asyncio
+from collections import namedtuple
+import itertools
+import threading
+
+from dice import Dice
+from dnd_char_no_ties_steph import BATCH_SIZE, TOP_N, WEIGHTING, Character, make_heap
+
+QUEUE_SIZE = 10_000
+SNAPSHOT_INTERVAL = 0.5
+
+# count: characters consumed so far
+# leaders: weight name -> [(priority, [characters])], highest priority first
+Snapshot = namedtuple("Snapshot", ["count", "leaders"])
+
+
+def character_feed(start_id=0, dice=None):
+    """Endless stream of freshly rolled characters."""
+    for id in itertools.count(start_id):
+        yield Character(id, dice)
+
+
+async def iterate_queue(queue, sentinel=None):
+    """Async iterator over an asyncio.Queue, ending at sentinel. A bounded
+    queue makes producers wait while the stream falls behind."""
+    while True:
+        item = await queue.get()
+        queue.task_done()
+        if item is sentinel:
+            return
+        yield item
+
+
+class TopCharacterStream:
+    def __init__(self, num_to_find=TOP_N, use_buckets=True, batch_size=BATCH_SIZE):
+        self.num_to_find = num_to_find
+        self.batch_size = batch_size
+        self.pqs = { weight_name: make_heap(weight_name, num_to_find, use_buckets)
+                     for weight_name in WEIGHTING.keys() }
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def push_many(self, characters):
+        with self.lock:
+            for pq in self.pqs.values():
+                pq.push_many(characters)
+            self.count += len(characters)
+
+    def consume(self, characters, limit=None):
+        """Push characters from an iterator until it ends (or limit are read)."""
+        characters = iter(characters) if limit is None else itertools.islice(characters, limit)
+        while True:
+            batch = list(itertools.islice(characters, self.batch_size))
+            if not batch:
+                return self.count
+            self.push_many(batch)
+
+    def consume_in_thread(self, characters, limit=None):
+        thread = threading.Thread(target=self.consume, args=(characters, limit), daemon=True)
+        thread.start()
+        return thread
+
+    async def consume_async(self, characters):
+        """Push characters from an async iterator until it ends. Items are only
+        pulled once the previous batch is in, and the event loop gets control
+        after every batch so snapshot() callers are never starved."""
+        batch = []
+        async for character in characters:
+            batch.append(character)
+            if len(batch) >= self.batch_size:
+                self.push_many(batch)
+                batch = []
+                await asyncio.sleep(0)
+        if batch:
+            self.push_many(batch)
+        return self.count
+
+    def snapshot(self):
+        with self.lock:
+            return Snapshot(self.count, { weight_name: pq.groups() for weight_name, pq in self.pqs.items() })
+
+    @staticmethod
+    def format_snapshot(snapshot):
+        lines = [f"After {snapshot.count} characters:"]
+        for weight_name, groups in snapshot.leaders.items():
+            lines.append(f"Top {sum(len(chars) for _, chars in groups)} (with ties) sorted by {weight_name}:")
+            lines.extend(str(char) for _, chars in groups for char in chars)
+        return "\n".join(lines)
+
+
+async def main(num_total=1_000_000):
+    stream = TopCharacterStream()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def produce():
+        for character in itertools.islice(character_feed(dice=Dice()), num_total):
+            await queue.put(character)
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    consumer = asyncio.create_task(stream.consume_async(iterate_queue(queue)))
+    while not consumer.done():
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        snapshot = stream.snapshot()
+        best = {name: groups[0][0] for name, groups in snapshot.leaders.items() if groups}
+        print(f"{snapshot.count:>10} characters, best so far {best}")
+    await producer
+    print(stream.format_snapshot(stream.snapshot()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,35 +4,116 @@ class Edge:
         self.v2 = v2
         self.weight = weight
             
+class CycleError(ValueError):
+    """An edge was rejected because it would close a cycle; cycle lists its
+    vertices from the edge's v1 back to v1."""
+
+    def __init__(self, cycle):
+        super().__init__(f"edge would create cycle {' -> '.join(map(str, cycle))}")
+        self.cycle = cycle
+
+
 class Graph:
-    """adjacency_map graph"""
+    """adjacency_map graph
+
+    A directed graph keeps a topological order of its vertices up to date as
+    edges are added (Pearce-Kelly dynamic topological sort): topological_order
+    lists the vertices in order and position maps each vertex to its index.
+    Inserting an edge only reorders vertices between the edge's endpoints that
+    are reachable from, or reach, them; an edge that would close a cycle is
+    rejected with a CycleError before the graph is changed.
+
+    version counts the vertices and edges added, so cached query results
+    (see shortestpath.py) can tell when they are stale.
+    """
         
     def __init__(self, directed=True, weighted=False):
         self.adjacency_map = {}
         self.directed = directed
         self.weighted = weighted
+        self.predecessors = {}
+        self.topological_order = []
+        self.position = {}
+        self.version = 0
     
     def addVert(self, vert):
         if self.adjacency_map.get(vert) is None:
             self.adjacency_map[vert] = set()
+            self.version += 1
+            if self.directed:
+                self.predecessors[vert] = set()
+                self.position[vert] = len(self.topological_order)
+                self.topological_order.append(vert)
                 
     def addVerts(self, verts):
         for vert in verts:
             self.addVert(vert)
     
     def addEdge(self, edge):
+        # a self-loop is the only cycle that can involve a new vertex, so
+        # with it checked first a CycleError never leaves a vertex behind
+        if self.directed and edge.v1 == edge.v2:
+            raise CycleError([edge.v1, edge.v1])
         self.addVert(edge.v1)
         self.addVert(edge.v2)
+        if self.directed:
+            self.reorderForEdge(edge.v1, edge.v2)
+            self.predecessors[edge.v2].add(edge.v1)
         self.adjacency_map[edge.v1].add(edge)
+        self.version += 1
         if not self.directed:
             reverse = Edge(edge.v2, edge.v1, edge.weight)
             self.adjacency_map[edge.v2].add(reverse)
             
     def addEdges(self, edges):
+        """Edges before one that raises CycleError stay added."""
         for edge in edges:
             self.addEdge(edge)
+
+    def reorderForEdge(self, v1, v2):
+        """Restore the topological order for a new edge v1 -> v2."""
+        position = self.position
+        lower, upper = position[v2], position[v1]
+        if lower > upper:
+            return
+
+        # vertices reachable from v2 that are not after v1; reaching v1 is a cycle
+        forward = {v2: None}
+        stack = [v2]
+        while stack:
+            vert = stack.pop()
+            for edge in self.adjacency_map[vert]:
+                w = edge.v2
+                if w == v1:
+                    path = [vert]
+                    while forward[path[-1]] is not None:
+                        path.append(forward[path[-1]])
+                    raise CycleError([v1] + path[::-1] + [v1])
+                if w not in forward and position[w] < upper:
+                    forward[w] = vert
+                    stack.append(w)
+
+        # vertices that reach v1 and are after v2
+        backward = {v1}
+        stack = [v1]
+        while stack:
+            vert = stack.pop()
+            for w in self.predecessors[vert]:
+                if w not in backward and position[w] > lower:
+                    backward.add(w)
+                    stack.append(w)
+
+        # everything that reaches v1 moves ahead of everything reachable from
+        # v2, reusing the same set of positions
+        affected = sorted(backward, key=position.__getitem__) + sorted(forward, key=position.__getitem__)
+        slots = sorted(position[vert] for vert in affected)
+        for vert, slot in zip(affected, slots):
+            position[vert] = slot
+            self.topological_order[slot] = vert
             
     def findTopologicalOrdering(self):
+        if self.directed:
+            return list(self.topological_order)
         indegree = {}
         for vert in self.adjacency_map.keys():
             indegree[vert] = 0
@@ -56,13 +137,52 @@ class Graph:
             return ["cyclic graph, no topological ordering"]
         else:
             return order
+
+    def verts(self):
+        return self.adjacency_map.keys()
+
+    def successors(self, vert):
+        return {edge.v2 for edge in self.adjacency_map[vert]}
+
+    def findTopologicalLayers(self):
+        """Kahn frontiers: the first layer has no predecessors and every other
+        vertex is in the layer after its last predecessor, so the vertices of
+        a layer are independent of each other."""
+        indegree = dict.fromkeys(self.adjacency_map, 0)
+        for edges in self.adjacency_map.values():
+            for edge in edges:
+                indegree[edge.v2] += 1
+        layers = []
+        layer = [vert for vert, count in indegree.items() if count == 0]
+        numPlaced = 0
+        while layer:
+            layers.append(layer)
+            numPlaced += len(layer)
+            nextLayer = []
+            for v1 in layer:
+                for edge in self.adjacency_map[v1]:
+                    indegree[edge.v2] -= 1
+                    if indegree[edge.v2] == 0:
+                        nextLayer.append(edge.v2)
+            layer = nextLayer
+        if numPlaced < len(indegree):
+            raise ValueError("cyclic graph, no topological ordering")
+        return layers
+
+    def criticalPathLength(self):
+        """Number of vertices on the longest dependency chain."""
+        return len(self.findTopologicalLayers())
     
     
 if __name__ ==  "__main__":
     g = Graph()
     g.addEdges([Edge(2,3), Edge(3,4), Edge(1,0), Edge(1,2), Edge(1,3)])
     print(g.findTopologicalOrdering())
+    print(g.findTopologicalLayers(), g.criticalPathLength())
     
-    g.addEdges([Edge(2,1)])
+    try:
+        g.addEdges([Edge(2,1)])
+    except CycleError as e:
+        print(e.cycle)
     print(g.findTopologicalOrdering())
     
\ No newline at end of file
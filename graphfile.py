@@ -0,0 +1,420 @@
+# Binary graph files that open without rebuilding the graph.
+#
+# A file is a CSR graph (see algraph.CSRGraph) laid out as:
+#
+#   header      32 bytes, HEADER below
+#   vertex ids  int64 per vertex, or for string vertices numVerts+1 int64
+#               offsets into the name blob at the end of the file
+#   offsets     int64 * (numVerts + 1)
+#   targets     int32 or int64 vertex ids (idSize), padded to 8 bytes
+#   weights     float64 * numEdges, if FLAG_WEIGHTED; NaN for an edge
+#               without a weight (Edge.weight None)
+#   names       UTF-8 vertex names, for string vertices only
+#
+# Writers preallocate the file and fill it through a writable mmap, so no
+# section is ever built in memory. loadGraph maps the file read-only and
+# hands out memoryviews cast straight onto it: opening a graph costs a few
+# page faults no matter how many edges it has.
+
+from array import array
+import math
+import mmap
+import os
+import struct
+
+from algraph import ALGraph, CSRGraph
+from graph import CycleError, Edge, Graph
+
+MAGIC = b"PIEGRAPH"
+FORMAT_VERSION = 1
+# magic, version, flags, idSize, vertKind, numVerts, numEdges
+HEADER = struct.Struct("<8sHHBB2xqq")
+FLAG_WEIGHTED = 1
+FLAG_DIRECTED = 2
+VERTS_INT = 0
+VERTS_STR = 1
+IMPORT_CHUNK = 1 << 20      # bytes of text read at a time by importEdgeList
+NO_WEIGHT = math.nan        # stored for Edge.weight None, read back as None
+
+
+def align(n):
+    return (n + 7) & ~7
+
+
+def layout(numVerts, numEdges, idSize, weighted):
+    """Byte offsets of each section; names start at layout(...)["end"]."""
+    sections = {}
+    pos = HEADER.size
+    sections["verts"] = pos
+    pos += 8 * (numVerts + 1)
+    sections["offsets"] = pos
+    pos += 8 * (numVerts + 1)
+    sections["targets"] = pos
+    pos = align(pos + idSize * numEdges)
+    sections["weights"] = pos
+    if weighted:
+        pos += 8 * numEdges
+    sections["end"] = pos
+    return sections
+
+
+def vertKindOf(verts):
+    if all(type(vert) is int for vert in verts):
+        return VERTS_INT
+    if all(type(vert) is str for vert in verts):
+        return VERTS_STR
+    raise TypeError("graph files hold int or str vertices, not a mix or other types")
+
+
+class FileWriter:
+    """Preallocated graph file with writable memoryviews of its sections.
+    Fill verts (for int vertices), offsets, targets and weights, then call
+    close(names) with the vertex names for string vertices."""
+
+    def __init__(self, path, numVerts, numEdges, weighted=False, directed=True, vertKind=VERTS_INT):
+        self.idSize = 4 if numVerts < 2**31 else 8
+        self.numVerts = numVerts
+        self.numEdges = numEdges
+        self.vertKind = vertKind
+        self.sections = layout(numVerts, numEdges, self.idSize, weighted)
+        flags = (FLAG_WEIGHTED if weighted else 0) | (FLAG_DIRECTED if directed else 0)
+
+        self.fp = open(path, "w+b")
+        self.fp.truncate(self.sections["end"])
+        self.mm = mmap.mmap(self.fp.fileno(), self.sections["end"])
+        self.mm[:HEADER.size] = HEADER.pack(MAGIC, FORMAT_VERSION, flags, self.idSize, vertKind,
+                                            numVerts, numEdges)
+        self.views = []
+        self.verts = self.view("verts", "q", numVerts + 1)
+        self.offsets = self.view("offsets", "q", numVerts + 1)
+        self.targets = self.view("targets", "i" if self.idSize == 4 else "q", numEdges)
+        self.weights = self.view("weights", "d", numEdges) if weighted else None
+
+    def view(self, section, typecode, count):
+        start = self.sections[section]
+        raw = memoryview(self.mm)[start:start + count * struct.calcsize(typecode)]
+        view = raw.cast(typecode)
+        self.views += [view, raw]
+        return view
+
+    def close(self, names=None):
+        if self.vertKind == VERTS_STR:
+            # the name blob goes after the mapped part, its offsets into verts
+            self.fp.seek(self.sections["end"])
+            pos = 0
+            for i, name in enumerate(names):
+                self.verts[i] = pos
+                data = name.encode()
+                self.fp.write(data)
+                pos += len(data)
+            self.verts[self.numVerts] = pos
+        for view in self.views:
+            view.release()
+        self.mm.close()
+        self.fp.close()
+
+
+def writeGraph(path, graph):
+    """Save a Graph, ALGraph or CSRGraph. An undirected Graph stores each
+    edge once, not the two Edge objects it keeps in memory."""
+    if isinstance(graph, Graph):
+        verts = list(graph.adjacency_map)
+        ids = {vert: i for i, vert in enumerate(verts)}
+        if graph.directed:
+            rows = [list(graph.adjacency_map[vert]) for vert in verts]
+        else:
+            rows = [undirectedRow(graph.adjacency_map[vert], i, ids) for i, vert in enumerate(verts)]
+        numEdges = sum(map(len, rows))
+        writer = FileWriter(path, len(verts), numEdges, graph.weighted, graph.directed, vertKindOf(verts))
+        pos = 0
+        for i, row in enumerate(rows):
+            writer.offsets[i] = pos
+            for edge in row:
+                writer.targets[pos] = ids[edge.v2]
+                if graph.weighted:
+                    writer.weights[pos] = NO_WEIGHT if edge.weight is None else edge.weight
+                pos += 1
+        writer.offsets[len(verts)] = pos
+    else:
+        if isinstance(graph, ALGraph):
+            graph = CSRGraph.fromALGraph(graph)
+        verts = list(graph.verts)
+        writer = FileWriter(path, len(verts), graph.numEdges(), vertKind=vertKindOf(verts))
+        writer.offsets[:] = memoryview(graph.offsets)
+        writer.targets[:] = memoryview(graph.targets)
+    if writer.vertKind == VERTS_INT:
+        writer.verts[:len(verts)] = memoryview(array("q", verts))
+    writer.close(verts)
+
+
+def undirectedRow(edges, i, ids):
+    """One side of each undirected edge. A self-loop is two Edge objects in
+    the same set, so only every other one (by weight) is kept."""
+    row = [edge for edge in edges if ids[edge.v2] > i]
+    loops = sorted((edge for edge in edges if ids[edge.v2] == i),
+                   key=lambda edge: (edge.weight is not None, edge.weight or 0))
+    return row + loops[::2]
+
+
+class StringTable:
+    """Read-only sequence of the vertex names in a mapped file, decoded on
+    access."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class MappedGraph(CSRGraph):
+    """A graph file opened with loadGraph. verts, offsets, targets and
+    weights are memoryviews onto the mapping (verts is a StringTable for
+    string vertices); close() unmaps it."""
+
+    def __init__(self, path):
+        self.fp = open(path, "rb")
+        self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, idSize, vertKind, numVerts, numEdges = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a graph file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+        self.weighted = bool(flags & FLAG_WEIGHTED)
+        self.directed = bool(flags & FLAG_DIRECTED)
+        self.sections = layout(numVerts, numEdges, idSize, self.weighted)
+        self.views = []
+        if vertKind == VERTS_INT:
+            verts = self.view("verts", "q", numVerts)
+        else:
+            blob = memoryview(self.mm)[self.sections["end"]:]
+            self.views.append(blob)
+            verts = StringTable(self.view("verts", "q", numVerts + 1), blob)
+        super().__init__(verts,
+                         self.view("offsets", "q", numVerts + 1),
+                         self.view("targets", "i" if idSize == 4 else "q", numEdges))
+        self.weights = self.view("weights", "d", numEdges) if self.weighted else None
+
+    def view(self, section, typecode, count):
+        start = self.sections[section]
+        raw = memoryview(self.mm)[start:start + count * struct.calcsize(typecode)]
+        view = raw.cast(typecode)
+        self.views += [view, raw]
+        return view
+
+    def close(self):
+        # every export has to go before the mapping can be closed
+        for view in self.views:
+            view.release()
+        self.mm.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def edges(self):
+        """(v1, v2, weight) for every stored edge; weight is None when the
+        file has no weights or the edge was saved without one."""
+        verts, offsets, targets, weights = self.verts, self.offsets, self.targets, self.weights
+        for i in range(len(verts)):
+            v1 = verts[i]
+            for pos in range(offsets[i], offsets[i + 1]):
+                weight = None if weights is None else weights[pos]
+                yield v1, verts[targets[pos]], None if weight is None or math.isnan(weight) else weight
+
+    def toALGraph(self):
+        g = ALGraph()
+        verts = list(self.verts)
+        g.addVerts(verts)
+        offsets, targets = self.offsets, self.targets
+        for i, vert in enumerate(verts):
+            g.adjacency_list[vert].update(verts[t] for t in targets[offsets[i]:offsets[i + 1]])
+        return g
+
+    def toGraph(self):
+        """A Graph of the file, built directly rather than edge by edge. A
+        directed Graph keeps a topological order, so a file with a directed
+        cycle raises CycleError before anything is built; open those with
+        toALGraph() or scc.condense()."""
+        g = Graph(directed=self.directed, weighted=self.weighted)
+        verts = list(self.verts)
+        adjacency = g.adjacency_map = {vert: set() for vert in verts}
+        if self.directed:
+            g.topological_order = [verts[i] for i in self.topologicalIds()]
+            g.position = {vert: i for i, vert in enumerate(g.topological_order)}
+            g.predecessors = {vert: set() for vert in verts}
+        for v1, v2, weight in self.edges():
+            adjacency[v1].add(Edge(v1, v2, weight))
+            if self.directed:
+                g.predecessors[v2].add(v1)
+            else:
+                adjacency[v2].add(Edge(v2, v1, weight))
+        g.version = len(verts) + len(self.targets)
+        return g
+
+    def topologicalIds(self):
+        """Vertex ids in topological order (Kahn's algorithm), or CycleError
+        naming one cycle."""
+        n = len(self.offsets) - 1
+        offsets, targets = self.offsets, self.targets
+        indegree = array("q", bytes(8 * n))
+        for t in targets:
+            indegree[t] += 1
+        order = [i for i in range(n) if indegree[i] == 0]
+        for i in order:
+            for t in targets[offsets[i]:offsets[i + 1]]:
+                indegree[t] -= 1
+                if indegree[t] == 0:
+                    order.append(t)
+        if len(order) == n:
+            return order
+        # every vertex left over has a left over predecessor: walk back
+        # through them until one repeats
+        pred = {}
+        for i in range(n):
+            if indegree[i]:
+                for t in targets[offsets[i]:offsets[i + 1]]:
+                    if indegree[t]:
+                        pred[t] = i
+        path = [next(iter(pred))]
+        seen = {path[0]: 0}
+        while pred[path[-1]] not in seen:
+            seen[pred[path[-1]]] = len(path)
+            path.append(pred[path[-1]])
+        cycle = path[seen[pred[path[-1]]]:][::-1]
+        raise CycleError([self.verts[i] for i in cycle + cycle[:1]])
+
+
+def loadGraph(path):
+    return MappedGraph(path)
+
+
+def readLines(path, chunkSize=IMPORT_CHUNK):
+    """Lines of a text file, read chunkSize bytes at a time."""
+    with open(path) as fp:
+        while True:
+            lines = fp.readlines(chunkSize)
+            if not lines:
+                return
+            yield from lines
+
+
+def edgeFields(path, weighted, chunkSize):
+    for line in readLines(path, chunkSize):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) < (3 if weighted else 2):
+            raise ValueError(f"bad edge line in {path}: {line!r}")
+        yield fields
+
+
+def importEdgeList(textPath, graphPath, weighted=False, directed=True, vertexType=int,
+                   chunkSize=IMPORT_CHUNK):
+    """Convert a whitespace separated edge list ("v1 v2" or "v1 v2 weight"
+    per line, # comments) into a graph file.
+
+    Two passes over the text: the first assigns vertex ids in order of
+    appearance and counts out-degrees, the second drops every edge straight
+    into its slot in the mapped file. Memory is the vertex table plus two
+    int64 per vertex, whatever the number of edges.
+    """
+    ids = {}
+    degree = array("q")
+    numEdges = 0
+    for fields in edgeFields(textPath, weighted, chunkSize):
+        for token in fields[:2]:
+            vert = vertexType(token)
+            if vert not in ids:
+                ids[vert] = len(ids)
+                degree.append(0)
+        degree[ids[vertexType(fields[0])]] += 1
+        numEdges += 1
+
+    verts = list(ids)
+    writer = FileWriter(graphPath, len(verts), numEdges, weighted, directed, vertKindOf(verts))
+    nextSlot = array("q", [0])
+    for count in degree:
+        nextSlot.append(nextSlot[-1] + count)
+    writer.offsets[:] = memoryview(nextSlot)
+    del degree
+
+    targets, weights = writer.targets, writer.weights
+    for fields in edgeFields(textPath, weighted, chunkSize):
+        v1 = ids[vertexType(fields[0])]
+        pos = nextSlot[v1]
+        nextSlot[v1] = pos + 1
+        targets[pos] = ids[vertexType(fields[1])]
+        if weighted:
+            weights[pos] = float(fields[2])
+    if writer.vertKind == VERTS_INT:
+        writer.verts[:len(verts)] = memoryview(array("q", verts))
+    writer.close(verts)
+
+
+def benchmark(numVerts=100_000, numEdges=1_000_000, seed=1, directory="."):
+    """Compare rebuilding an ALGraph from an edge list with opening the same
+    graph from a file."""
+    import random
+    import time
+
+    rng = random.Random(seed)
+    textPath = os.path.join(directory, "bench_edges.txt")
+    graphPath = os.path.join(directory, "bench_edges.graph")
+    with open(textPath, "w") as fp:
+        for i in range(numEdges):
+            v1, v2 = rng.randrange(numVerts), rng.randrange(numVerts)
+            fp.write(f"{min(v1, v2)} {max(v1, v2) + (v1 == v2)}\n")
+
+    start = time.perf_counter()
+    importEdgeList(textPath, graphPath)
+    print(f"import {numEdges:,} edges: {time.perf_counter() - start:.2f}s, "
+          f"{os.path.getsize(graphPath) / 2**20:.1f} MB file")
+
+    start = time.perf_counter()
+    g = ALGraph()
+    with open(textPath) as fp:
+        g.addEdges(tuple(map(int, line.split())) for line in fp)
+    print(f"ALGraph rebuild from text: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    with loadGraph(graphPath) as mapped:
+        opened = time.perf_counter() - start
+        print(f"loadGraph: {opened * 1000:.2f} ms for {mapped.numEdges():,} edges")
+        start = time.perf_counter()
+        mapped.findTopologicalOrdering()
+        print(f"topological sort on the mapping: {time.perf_counter() - start:.2f}s")
+    os.remove(textPath)
+    os.remove(graphPath)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "demo.graph")
+
+        g = ALGraph()
+        g.addEdges([[2,3], [3,4], [1,0], [1,2], [1,3]])
+        writeGraph(path, g)
+        with loadGraph(path) as mapped:
+            print(mapped.findTopologicalOrdering(), g.findTopologicalOrdering())
+            print(mapped.toALGraph().adjacency_list)
+
+        wg = Graph(directed=False, weighted=True)
+        wg.addEdges([Edge("a", "b", 1.5), Edge("b", "c", 2), Edge("c", "a", 0.5)])
+        writeGraph(path, wg)
+        with loadGraph(path) as mapped:
+            print(list(mapped.edges()))
+
+        benchmark(directory=directory)
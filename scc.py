@@ -0,0 +1,193 @@
+# Strongly connected components and the condensation DAG.
+#
+# findTopologicalOrdering gives up on a cyclic graph. condense() instead
+# collapses every strongly connected component (a cycle and everything on
+# cycles with it) to one vertex; what is left is a DAG, so the components
+# always have a topological order and ordering() flattens it into a vertex
+# order in which every edge between different components points forward.
+#
+# Tarjan's algorithm runs over CSR arrays with an explicit stack of
+# (vertex, next edge) frames instead of recursion, so a million-vertex chain
+# needs no recursion limit, and all of it is linear in vertices + edges.
+
+from array import array
+
+from algraph import ALGraph, CSRGraph, idTypecode
+
+
+def csrArrays(graph):
+    """(verts, offsets, targets) for a Graph, ALGraph or CSRGraph."""
+    if isinstance(graph, ALGraph):
+        graph = CSRGraph.fromALGraph(graph)
+    if isinstance(graph, CSRGraph):
+        return graph.verts, graph.offsets, graph.targets
+    verts = list(graph.verts())
+    ids = {vert: i for i, vert in enumerate(verts)}
+    offsets = array('q', [0])
+    targets = array(idTypecode(len(verts)))
+    for vert in verts:
+        targets.extend([ids[v2] for v2 in graph.successors(vert)])
+        offsets.append(len(targets))
+    return verts, offsets, targets
+
+
+def tarjan(numVerts, offsets, targets):
+    """Component number of every vertex id. Tarjan finishes a component only
+    after everything it reaches, so component 0 is a sink and numbering them
+    in reverse is a topological order."""
+    index = array('q', [-1]) * numVerts
+    low = array('q', [0]) * numVerts
+    component = array('q', [-1]) * numVerts
+    onStack = bytearray(numVerts)
+    stack = []
+    counter = 0
+    numComponents = 0
+    for root in range(numVerts):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = 1
+        work = [(root, offsets[root])]
+        while work:
+            v, pos = work[-1]
+            end = offsets[v + 1]
+            while pos < end:
+                w = targets[pos]
+                pos += 1
+                if index[w] == -1:
+                    # descend into w, resuming v at pos afterwards
+                    work[-1] = (v, pos)
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    onStack[w] = 1
+                    work.append((w, offsets[w]))
+                    break
+                if onStack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        onStack[w] = 0
+                        component[w] = numComponents
+                        if w == v:
+                            break
+                    numComponents += 1
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+    # renumber so component 0 comes first topologically
+    last = numComponents - 1
+    for i in range(numVerts):
+        component[i] = last - component[i]
+    return numComponents, component
+
+
+class Condensation:
+    """Result of condense().
+
+    components lists the vertices of each component, components in
+    topological order. componentOf maps a vertex id (its position in verts)
+    to its component. dag is the condensation as a CSRGraph whose vertices
+    are component numbers, with one edge per connected pair of components.
+    """
+
+    def __init__(self, verts, components, componentOf, dag):
+        self.verts = verts
+        self.components = components
+        self.componentOf = componentOf
+        self.dag = dag
+
+    def ordering(self):
+        """Every vertex, component by component in topological order."""
+        return [vert for component in self.components for vert in component]
+
+    def cycles(self):
+        """Components that contain a cycle (more than one vertex). A single
+        vertex with a self-loop is not included."""
+        return [component for component in self.components if len(component) > 1]
+
+
+def condense(graph):
+    verts, offsets, targets = csrArrays(graph)
+    numVerts = len(verts)
+    numComponents, componentOf = tarjan(numVerts, offsets, targets)
+
+    # bucket vertex ids by component (counting sort)
+    start = array('q', [0]) * (numComponents + 1)
+    for c in componentOf:
+        start[c + 1] += 1
+    for c in range(numComponents):
+        start[c + 1] += start[c]
+    members = array(idTypecode(numVerts), [0]) * numVerts
+    nextSlot = start[:-1]
+    for v in range(numVerts):
+        c = componentOf[v]
+        members[nextSlot[c]] = v
+        nextSlot[c] += 1
+
+    # condensation edges, deduplicated with a per-target marker
+    dagOffsets = array('q', [0])
+    dagTargets = array(idTypecode(numComponents))
+    seen = array('q', [-1]) * numComponents
+    vertAt = verts.__getitem__
+    components = [list(map(vertAt, members[start[c]:start[c + 1]])) for c in range(numComponents)]
+    for c in range(numComponents):
+        for i in range(start[c], start[c + 1]):
+            v = members[i]
+            for pos in range(offsets[v], offsets[v + 1]):
+                cw = componentOf[targets[pos]]
+                if cw != c and seen[cw] != c:
+                    seen[cw] = c
+                    dagTargets.append(cw)
+        dagOffsets.append(len(dagTargets))
+    dag = CSRGraph(range(numComponents), dagOffsets, dagTargets)
+    return Condensation(verts, components, componentOf, dag)
+
+
+def benchmark(numVerts=1_000_000, numEdges=3_000_000, seed=1):
+    """Random graphs and adversarial long chains: one cycle through every
+    vertex (a single component found at DFS depth numVerts) and a plain path
+    (numVerts singleton components).
+
+    Python 3.11, defaults (1M verts):
+        random 3M edges   113k components   6.8s
+        cycle chain       1 component        2.0s
+        path chain        1M components      6.6s
+    """
+    import random
+    import sys
+    import time
+
+    rng = random.Random(seed)
+    cases = {
+        "random": [(rng.randrange(numVerts), rng.randrange(numVerts)) for i in range(numEdges)],
+        "cycle chain": [(i, (i + 1) % numVerts) for i in range(numVerts)],
+        "path chain": [(i, i + 1) for i in range(numVerts - 1)],
+    }
+    print(f"recursion limit {sys.getrecursionlimit()}, DFS depth up to {numVerts:,}")
+    for name, edges in cases.items():
+        graph = CSRGraph.fromEdges(edges)
+        start = time.perf_counter()
+        result = condense(graph)
+        elapsed = time.perf_counter() - start
+        largest = max(map(len, result.components))
+        print(f"{name:<12} {len(graph.verts):>10,} verts {graph.numEdges():>10,} edges  "
+              f"{len(result.components):>10,} components (largest {largest:,})  {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    g = ALGraph()
+    g.addEdges([[2,3], [3,4], [1,0], [1,2], [1,3], [4,2], [5,1]])
+    print(g.findTopologicalOrdering())
+    result = condense(g)
+    print(result.components, result.ordering(), result.cycles())
+    print({i: list(result.dag.targets[result.dag.offsets[i]:result.dag.offsets[i + 1]])
+           for i in result.dag.verts})
+
+    benchmark()
@@ -0,0 +1,230 @@
+# Shortest-path queries over a graph.Graph, using Edge.weight (1 for edges
+# without a weight).
+#
+# ShortestPaths builds a compact adjacency (vert -> {neighbour: weight}) once
+# per graph version and runs every query against it. Parallel edges collapse
+# to their lightest weight, and an undirected edge, which Graph stores as two
+# Edge objects, becomes one entry per direction instead of being revisited
+# through both objects. Results go into an LRU cache that is dropped as soon
+# as graph.version shows a vertex or edge was added.
+
+from collections import OrderedDict
+import heapq
+import itertools
+import math
+
+CACHE_SIZE = 128
+
+
+def edgeWeight(edge):
+    return 1 if edge.weight is None else edge.weight
+
+
+class ShortestPaths:
+    """Query engine for one Graph.
+
+    Every query returns (dist, parent): dist maps each reached vertex to its
+    distance from the nearest source and parent maps it to the previous vertex
+    on that path (None for sources). The dicts are shared with the cache, so
+    do not modify them.
+    """
+    def __init__(self, graph, cacheSize=CACHE_SIZE):
+        self.graph = graph
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.adjacency = None
+        self.hasNegative = False
+
+    def refresh(self):
+        """Rebuild the adjacency and empty the cache if the graph changed."""
+        if self.version == self.graph.version:
+            return
+        adjacency = {}
+        hasNegative = False
+        for vert, edges in self.graph.adjacency_map.items():
+            neighbours = adjacency[vert] = {}
+            for edge in edges:
+                weight = edgeWeight(edge)
+                if weight < 0:
+                    hasNegative = True
+                if neighbours.get(edge.v2, math.inf) > weight:
+                    neighbours[edge.v2] = weight
+        self.adjacency = adjacency
+        self.hasNegative = hasNegative
+        self.cache.clear()
+        self.version = self.graph.version
+
+    def cached(self, key, compute):
+        self.refresh()
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses += 1
+        result = compute()
+        self.cache[key] = result
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return result
+
+    def dijkstra(self, sources, target=None):
+        """Distances from the nearest of sources (a vertex or an iterable of
+        vertices), for non-negative weights. With a target the search stops
+        once the target is settled, so only vertices at most as far as the
+        target are guaranteed final."""
+        sources = self.sourceKey(sources)
+        if target is not None:
+            # a complete search from the same sources already answers it
+            self.refresh()
+            full = ("dijkstra", sources, None)
+            if full in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(full)
+                return self.cache[full]
+        return self.cached(("dijkstra", sources, target), lambda: self.runDijkstra(sources, target))
+
+    def runDijkstra(self, sources, target):
+        if self.hasNegative:
+            raise ValueError("negative edge weight, use dagShortest on a DAG")
+        adjacency = self.adjacency
+        dist = {}
+        parent = {}
+        # the counter breaks distance ties so vertices are never compared
+        counter = itertools.count()
+        heap = []
+        for source in sources:
+            parent[source] = None
+            dist[source] = 0
+            heap.append((0, next(counter), source))
+        heapq.heapify(heap)
+        done = set()
+        while heap:
+            d, _, vert = heapq.heappop(heap)
+            if vert in done:
+                continue            # lazy deletion of a superseded entry
+            done.add(vert)
+            if vert == target:
+                break
+            for w, weight in adjacency[vert].items():
+                if w in done:
+                    continue
+                nd = d + weight
+                if nd < dist.get(w, math.inf):
+                    dist[w] = nd
+                    parent[w] = vert
+                    heapq.heappush(heap, (nd, next(counter), w))
+        return dist, parent
+
+    def dagShortest(self, sources):
+        """Single pass over the graph's topological order; weights may be
+        negative. Directed graphs only."""
+        sources = self.sourceKey(sources)
+        return self.cached(("dagShortest", sources), lambda: self.runDag(sources, 1))
+
+    def dagLongest(self, sources):
+        """Heaviest paths from sources, e.g. the critical path of a job graph
+        with durations as weights. Directed graphs only."""
+        sources = self.sourceKey(sources)
+        return self.cached(("dagLongest", sources), lambda: self.runDag(sources, -1))
+
+    def runDag(self, sources, sign):
+        # sign -1 turns longest into shortest over negated weights
+        if not self.graph.directed:
+            raise ValueError("DAG paths need a directed graph")
+        if not sources:
+            return {}, {}       # nothing is reached, as with dijkstra
+        adjacency = self.adjacency
+        order = self.graph.topological_order
+        dist = {source: 0 for source in sources}
+        parent = {source: None for source in sources}
+        first = min(self.graph.position[source] for source in sources)
+        for vert in order[first:]:
+            d = dist.get(vert)
+            if d is None:
+                continue
+            for w, weight in adjacency[vert].items():
+                nd = d + weight
+                old = dist.get(w)
+                if old is None or sign * nd < sign * old:
+                    dist[w] = nd
+                    parent[w] = vert
+        return dist, parent
+
+    def shortestPath(self, source, target):
+        """(distance, [source, ..., target]), or (inf, []) if unreachable.
+        Uses Dijkstra with early exit at target."""
+        dist, parent = self.dijkstra(source, target)
+        return self.pathTo(dist, parent, target)
+
+    @staticmethod
+    def pathTo(dist, parent, target):
+        if target not in dist:
+            return math.inf, []
+        path = [target]
+        while parent[path[-1]] is not None:
+            path.append(parent[path[-1]])
+        return dist[target], path[::-1]
+
+    def sourceKey(self, sources):
+        try:
+            single = sources in self.graph.adjacency_map
+        except TypeError:       # unhashable, so a list of sources
+            single = False
+        if single:
+            sources = (sources,)
+        sources = frozenset(sources)
+        for source in sources:
+            if source not in self.graph.adjacency_map:
+                raise KeyError(source)
+        return sources
+
+    def cacheInfo(self):
+        return f"hits={self.hits} misses={self.misses} size={len(self.cache)}/{self.cacheSize}"
+
+
+def benchmark(numVerts=100_000, numEdges=1_000_000, seed=1):
+    import random
+    import time
+    from graph import Edge, Graph
+
+    rng = random.Random(seed)
+    g = Graph(directed=False, weighted=True)
+    g.addVerts(range(numVerts))
+    for i in range(numEdges // 2):
+        v1, v2 = rng.randrange(numVerts), rng.randrange(numVerts)
+        g.addEdge(Edge(v1, v2, rng.randint(1, 100)))
+
+    paths = ShortestPaths(g)
+    start = time.perf_counter()
+    paths.refresh()
+    print(f"adjacency for {numVerts:,} verts, {numEdges:,} edge objects: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    dist, parent = paths.dijkstra(0)
+    print(f"full Dijkstra from 0: {len(dist):,} reached in {time.perf_counter() - start:.2f}s")
+    paths.cache.clear()
+    start = time.perf_counter()
+    print("0 -> 1:", paths.shortestPath(0, 1), f"in {time.perf_counter() - start:.4f}s (early exit)")
+    start = time.perf_counter()
+    paths.shortestPath(0, 1)
+    print(f"repeat query: {time.perf_counter() - start:.6f}s, {paths.cacheInfo()}")
+
+
+if __name__ == "__main__":
+    from graph import Edge, Graph
+
+    g = Graph(weighted=True)
+    g.addEdges([Edge(0, 1, 4), Edge(0, 2, 1), Edge(2, 1, 2), Edge(1, 3, 1), Edge(2, 3, 5), Edge(3, 4, 3)])
+    paths = ShortestPaths(g)
+    print("dijkstra 0 -> 4:", paths.shortestPath(0, 4))
+    print("dag shortest from 0:", paths.dagShortest(0)[0])
+    print("dag longest from 0:", paths.pathTo(*paths.dagLongest(0), 4))
+    print("multi-source {0, 2}:", paths.dijkstra([0, 2])[0])
+    paths.shortestPath(0, 4)
+    print(paths.cacheInfo())
+    g.addEdge(Edge(0, 4, 2))
+    print("after adding 0 -> 4:", paths.shortestPath(0, 4), paths.cacheInfo())
+
+    benchmark()
@@ -1,21 +1,437 @@
 
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableMapping
+import itertools
 from operator import itemgetter
 
-foo = ( ('a','X'), ('g','c'), ('Z','w'), ('D','E') )
-print("Initial tuple:\n", foo)
+# Re-sorting the items into a new dict every time the order is needed costs
+# O(n log n) per refresh. SortedDict keeps the order as it goes: its keys
+# live in a list of sorted sublists of at most 2 * LOAD entries, so adding or
+# removing a key is a bisect over the sublist maxima, a bisect inside one
+# sublist and a short list insert or delete. Positions (indexing, bisect,
+# islice) go through a Fenwick tree over the sublist lengths, which is
+# updated in O(log n) when a sublist grows or shrinks and rebuilt lazily,
+# in O(n / LOAD), only when sublists are split or dropped.
 
-bar = [ (y.lower(), x ) for x,y in foo ]
-print("Transformed:\n", bar)
+LOAD = 1000
 
-# Dict construction order preserved in Python 3.7+
-baz = { x:y for x,y in sorted(bar) }
-print("Dict comprehension sorted by key:\n", baz)
 
-moo = { x:y for x,y in sorted(bar, key=itemgetter(1)) }
-print("Dict comprehension sorted by value:\n", moo)
+class SortedList:
+    """Sorted sequence of comparable entries (duplicates allowed)."""
 
-moo2 = { x:y for x,y in sorted(bar, key=lambda c : c[1].lower()) }
-print("Dict comprehension sorted by value (case insensitive):\n", moo2)
+    def __init__(self, iterable=()):
+        self.lists = []
+        self.maxes = []
+        self.size = 0
+        self.tree = None
+        for entry in iterable:
+            self.add(entry)
 
-moo3 = { x:y for x,y in sorted(bar, key=itemgetter(1)) if y.islower()}
-print("Dict comprehension sorted by value, filtering for lowercase:\n", moo3)
+    @classmethod
+    def from_sorted(cls, entries):
+        """Bulk load already sorted entries in O(n), LOAD to a sublist."""
+        self = cls()
+        entries = list(entries)
+        if any(b < a for a, b in zip(entries, entries[1:])):
+            raise ValueError("entries are not sorted")
+        self.lists = [entries[i:i + LOAD] for i in range(0, len(entries), LOAD)]
+        self.maxes = [sub[-1] for sub in self.lists]
+        self.size = len(entries)
+        self.tree = None
+        return self
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.lists)
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(map(reversed, reversed(self.lists)))
+
+    def _build_tree(self):
+        """Fenwick tree: tree[i] sums the lengths of the sublists i - (i & -i)
+        up to i - 1."""
+        tree = [0]
+        tree.extend(map(len, self.lists))
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _grow(self, i, delta):
+        tree = self.tree
+        if tree is None:
+            return
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _offset(self, i):
+        """Number of entries in sublists 0 to i - 1."""
+        if self.tree is None:
+            self._build_tree()
+        tree = self.tree
+        total = 0
+        while i:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, entry):
+        lists, maxes = self.lists, self.maxes
+        if not maxes:
+            lists.append([entry])
+            maxes.append(entry)
+            self.tree = None
+        else:
+            i = bisect_right(maxes, entry)
+            if i == len(maxes):
+                i -= 1
+                lists[i].append(entry)
+                maxes[i] = entry
+            else:
+                insort(lists[i], entry)
+            if len(lists[i]) > 2 * LOAD:
+                sub = lists[i]
+                lists[i:i + 1] = [sub[:LOAD], sub[LOAD:]]
+                maxes[i:i + 1] = [sub[LOAD - 1], sub[-1]]
+                self.tree = None
+            else:
+                self._grow(i, 1)
+        self.size += 1
+
+    def remove(self, entry):
+        lists, maxes = self.lists, self.maxes
+        i = bisect_left(maxes, entry)
+        if i < len(maxes):
+            sub = lists[i]
+            j = bisect_left(sub, entry)
+            if sub[j] == entry:
+                del sub[j]
+                self.size -= 1
+                if not sub:
+                    del lists[i], maxes[i]
+                    self.tree = None
+                    return
+                if j == len(sub):
+                    maxes[i] = sub[-1]
+                self._grow(i, -1)
+                return
+        raise ValueError(f"{entry!r} not in list")
+
+    def locate(self, index):
+        """(sublist number, position in it) of entry number index."""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("index out of range")
+        if self.tree is None:
+            self._build_tree()
+        # descend the Fenwick tree to the last sublist starting at or before index
+        tree = self.tree
+        i = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            if i + step < len(tree) and tree[i + step] <= index:
+                i += step
+                index -= tree[i]
+            step >>= 1
+        return i, index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.islice(*index.indices(self.size)))
+        i, j = self.locate(index)
+        return self.lists[i][j]
+
+    def islice(self, start=0, stop=None, step=1):
+        """Entries start to stop (both from 0 and non-negative), starting in
+        the right sublist rather than counting up to start."""
+        if stop is None:
+            stop = self.size
+        stop = min(stop, self.size)
+        if start >= stop:
+            return iter(())
+        i, j = self.locate(start)
+        rest = itertools.chain(itertools.islice(self.lists[i], j, None),
+                               itertools.chain.from_iterable(itertools.islice(self.lists, i + 1, None)))
+        return itertools.islice(rest, 0, stop - start, step)
+
+    def bisect_left(self, entry):
+        i = bisect_left(self.maxes, entry)
+        return self._offset(i) + (bisect_left(self.lists[i], entry) if i < len(self.lists) else 0)
+
+    def bisect_right(self, entry):
+        i = bisect_right(self.maxes, entry)
+        return self._offset(i) + (bisect_right(self.lists[i], entry) if i < len(self.lists) else 0)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Entries from minimum to maximum (None for open ended), in order."""
+        lists, maxes = self.lists, self.maxes
+        if minimum is None:
+            i, j = 0, 0
+        else:
+            find = bisect_left if inclusive[0] else bisect_right
+            i = find(maxes, minimum)
+            if i == len(maxes):
+                return
+            j = find(lists[i], minimum)
+        for sub in itertools.islice(lists, i, None):
+            for entry in itertools.islice(sub, j, None):
+                if maximum is not None and (entry > maximum or not inclusive[1] and entry == maximum):
+                    return
+                yield entry
+            j = 0
+
+
+class SortedDict(MutableMapping):
+    """dict whose keys are kept sorted by key(k) (the keys themselves by
+    default). Ties between keys with equal key(k) go by the keys.
+
+    With value_key, a second index orders the items by value_key(value) (ties
+    by key order): value_key=lambda v: v is sorted(items, key=itemgetter(1))
+    and value_key=str.lower is sorted(items, key=lambda c: c[1].lower()).
+    Setting, deleting and popping are O(log n) plus a short list move.
+    """
+
+    def __init__(self, items=(), key=None, value_key=None):
+        self.data = {}
+        self.key = key
+        self.value_key = value_key
+        self.order = SortedList()
+        self.value_order = SortedList() if value_key is not None else None
+        self.update(items)
+
+    @classmethod
+    def from_sorted(cls, items, key=None, value_key=None):
+        """Bulk load (key, value) pairs already in key order, without a
+        per-item insert. Raises ValueError if they are not."""
+        self = cls(key=key, value_key=value_key)
+        items = list(items)
+        self.data = dict(items)
+        if len(self.data) != len(items):
+            raise ValueError("duplicate keys")
+        self.order = SortedList.from_sorted(map(self.entry, self.data))
+        if value_key is not None:
+            self.value_order = SortedList.from_sorted(sorted(self.value_entry(k, v) for k, v in items))
+        return self
+
+    def entry(self, k):
+        return k if self.key is None else (self.key(k), k)
+
+    def key_of(self, entry):
+        return entry if self.key is None else entry[1]
+
+    def value_entry(self, k, v):
+        return (self.value_key(v), self.entry(k))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, k):
+        return k in self.data
+
+    def __getitem__(self, k):
+        return self.data[k]
+
+    def __setitem__(self, k, v):
+        data = self.data
+        if k in data:
+            if self.value_order is not None:
+                self.value_order.remove(self.value_entry(k, data[k]))
+        else:
+            self.order.add(self.entry(k))
+        data[k] = v
+        if self.value_order is not None:
+            self.value_order.add(self.value_entry(k, v))
+
+    def __delitem__(self, k):
+        v = self.data.pop(k)
+        self.order.remove(self.entry(k))
+        if self.value_order is not None:
+            self.value_order.remove(self.value_entry(k, v))
+
+    def __iter__(self):
+        return map(self.key_of, self.order)
+
+    def __reversed__(self):
+        return map(self.key_of, reversed(self.order))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({{{', '.join(f'{k!r}: {v!r}' for k, v in self.items())}}})"
+
+    def peekitem(self, index=-1):
+        if not self.data:
+            raise KeyError('peekitem(): dictionary is empty')
+        k = self.key_of(self.order[index])
+        return k, self.data[k]
+
+    def popitem(self, index=-1):
+        if not self.data:
+            raise KeyError('popitem(): dictionary is empty')
+        k, v = self.peekitem(index)
+        del self[k]
+        return k, v
+
+    def clear(self):
+        self.data = {}
+        self.order = SortedList()
+        if self.value_order is not None:
+            self.value_order = SortedList()
+
+    def bisect_left(self, k):
+        return self.order.bisect_left(self.entry(k))
+
+    def bisect_right(self, k):
+        return self.order.bisect_right(self.entry(k))
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Keys from minimum to maximum, both given as keys. With key, the
+        bounds are compared by key(k), so every key tying with a bound is
+        in the range (unless that end is exclusive)."""
+        if self.key is None:
+            return self.order.irange(minimum, maximum, inclusive)
+        return self._key_range(minimum, maximum, inclusive)
+
+    def _key_range(self, minimum, maximum, inclusive):
+        low = None if minimum is None else self.key(minimum)
+        high = None if maximum is None else self.key(maximum)
+        for kkey, k in self.order.irange(None if low is None else (low,)):
+            if not inclusive[0] and kkey == low:
+                continue
+            if high is not None and (kkey > high or not inclusive[1] and kkey == high):
+                return
+            yield k
+
+    def islice(self, start=0, stop=None):
+        """(key, value) pairs by position, like sorted(d.items())[start:stop]."""
+        data = self.data
+        return ((k, data[k]) for k in map(self.key_of, self.order.islice(start, stop)))
+
+    def by_value(self):
+        """(key, value) pairs in value order."""
+        if self.value_order is None:
+            raise TypeError("SortedDict was created without a value_key")
+        data = self.data
+        return ((k, data[k]) for k in (self.key_of(entry) for _, entry in self.value_order))
+
+    def value_range(self, minimum=None, maximum=None):
+        """(key, value) pairs whose value_key(value) is from minimum to
+        maximum, both inclusive, in value order."""
+        if self.value_order is None:
+            raise TypeError("SortedDict was created without a value_key")
+        data = self.data
+        for vkey, entry in self.value_order.irange(None if minimum is None else (minimum,)):
+            if maximum is not None and vkey > maximum:
+                return
+            k = self.key_of(entry)
+            yield k, data[k]
+
+
+def check(size=5000, seed=1):
+    """Regression checks: clear() and popitem() on an empty dict, and the
+    positional queries against a plain sorted list through splits and
+    deletes."""
+    import random
+
+    rng = random.Random(seed)
+    sd = SortedDict(((rng.random(), i) for i in range(size)), value_key=lambda v: -v)
+    sd.clear()
+    assert len(sd) == 0 and list(sd) == [] and list(sd.by_value()) == []
+    for pop in (sd.popitem, sd.peekitem):
+        try:
+            pop()
+        except KeyError:
+            pass
+        else:
+            raise AssertionError(f"{pop.__name__}() on an empty SortedDict did not raise KeyError")
+    SortedDict().clear()
+
+    entries, plain = SortedList(), []
+    for i in range(size * 2):
+        if plain and rng.random() < 0.4:
+            entry = plain.pop(rng.randrange(len(plain)))
+            entries.remove(entry)
+        else:
+            entry = rng.randrange(size)
+            entries.add(entry)
+            plain.append(entry)
+        if i % 97 == 0:
+            plain.sort()
+            probe = rng.randrange(size)
+            assert entries.bisect_left(probe) == bisect_left(plain, probe)
+            assert entries.bisect_right(probe) == bisect_right(plain, probe)
+            if plain:
+                index = rng.randrange(len(plain))
+                assert entries[index] == plain[index] and entries[-1] == plain[-1]
+                assert list(entries.islice(index, index + 50)) == plain[index:index + 50]
+    assert list(entries) == sorted(plain)
+
+
+def benchmark(size=100_000, rounds=100, updates=10, seed=1):
+    """Keep a map of size keys ordered through rounds of a few updates,
+    reading the first few items in key and in value order each round."""
+    import random
+    import time
+
+    rng = random.Random(seed)
+    keys = [f"k{i:07}" for i in range(size)]
+    values = [rng.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ') * 3 for i in range(size)]
+    changes = [[(rng.choice(keys), rng.choice(values)) for j in range(updates)] for i in range(rounds)]
+
+    start = time.perf_counter()
+    plain = dict(zip(keys, values))
+    for batch in changes:
+        plain.update(batch)
+        by_key = { x:y for x,y in sorted(plain.items()) }
+        by_value = { x:y for x,y in sorted(plain.items(), key=lambda c : c[1].lower()) }
+        head = list(itertools.islice(by_key.items(), 10)), list(itertools.islice(by_value.items(), 10))
+    rebuild = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sd = SortedDict.from_sorted(zip(keys, values), value_key=str.lower)
+    loaded = time.perf_counter() - start
+    for batch in changes:
+        sd.update(batch)
+        head2 = list(sd.islice(0, 10)), list(itertools.islice(sd.by_value(), 10))
+    maintained = time.perf_counter() - start
+
+    assert head[0] == head2[0] and len(head[1]) == len(head2[1])
+    print(f"{size:,} keys, {rounds:,} rounds of {updates} updates")
+    print(f"rebuild with sorted():  {rebuild:8.3f}s")
+    print(f"SortedDict:             {maintained:8.3f}s (bulk load {loaded:.3f}s)")
+
+
+if __name__ == "__main__":
+    foo = ( ('a','X'), ('g','c'), ('Z','w'), ('D','E') )
+    print("Initial tuple:\n", foo)
+
+    bar = [ (y.lower(), x ) for x,y in foo ]
+    print("Transformed:\n", bar)
+
+    # Dict construction order preserved in Python 3.7+
+    baz = { x:y for x,y in sorted(bar) }
+    print("Dict comprehension sorted by key:\n", baz)
+
+    moo = { x:y for x,y in sorted(bar, key=itemgetter(1)) }
+    print("Dict comprehension sorted by value:\n", moo)
+
+    moo2 = { x:y for x,y in sorted(bar, key=lambda c : c[1].lower()) }
+    print("Dict comprehension sorted by value (case insensitive):\n", moo2)
+
+    moo3 = { x:y for x,y in sorted(bar, key=itemgetter(1)) if y.islower()}
+    print("Dict comprehension sorted by value, filtering for lowercase:\n", moo3)
+
+    sd = SortedDict(bar, value_key=str.lower)
+    print("SortedDict:\n", sd)
+    print("SortedDict by value (case insensitive):\n", dict(sd.by_value()))
+    sd['b'] = 'a'
+    del sd['x']
+    print("After sd['b'] = 'a' and del sd['x']:\n", sd, dict(sd.by_value()))
+    print("Keys 'b'..'e':", list(sd.irange('b', 'e')))
+
+    check()
+    benchmark()
@@ -1,6 +1,13 @@
+import argparse
+import json
+import statistics
+import sys
 import timeit
 
-TIMES = 10000
+TARGET_TIME = 0.2   # seconds per timed repeat, used to calibrate the loop count
+REPEAT = 7
+THRESHOLD = 0.05    # relative change below which a difference is never flagged
+MIN_REPEAT = 5      # repeats both runs need before a difference can be flagged
 
 SETUP = """
 symbols = tuple(chr(x) for x in range(1,256))
@@ -8,11 +15,123 @@ def non_ascii(c):
     return c > 127
 """
 
-def clock(label, cmd):
-    res = timeit.repeat(cmd, setup=SETUP, number=TIMES)
-    print(label, *('{:.3f}'.format(x) for x in res))
+# suite name -> [(label, statement, setup)]
+SUITES = {}
 
-clock('listcomp        :', '[ord(s) for s in symbols if ord(s) > 127]')
-clock('listcomp + func :', '[ord(s) for s in symbols if non_ascii(ord(s))]')
-clock('filter + lambda :', 'list(filter(lambda c: c > 127, map(ord, symbols)))')
-clock('filter + func   :', 'list(filter(non_ascii, map(ord, symbols)))')
+def register(suite, label, cmd, setup=SETUP):
+    SUITES.setdefault(suite, []).append((label, cmd, setup))
+
+def calibrate(timer, target=TARGET_TIME):
+    """Smallest loop count (1, 2, 5, 10, 20, ...) whose run takes at least target seconds."""
+    number = 1
+    while True:
+        for multiplier in (1, 2, 5):
+            loops = number * multiplier
+            if timer.timeit(loops) >= target:
+                return loops
+        number *= 10
+
+def summarize(label, number, times):
+    per_op = sorted(t / number for t in times)
+    if len(per_op) < 2:
+        q1 = median = q3 = per_op[0]
+    else:
+        q1, median, q3 = statistics.quantiles(per_op, n=4, method="inclusive")
+    return {
+        "label": label,
+        "number": number,
+        "times": times,
+        "min": per_op[0],
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+    }
+
+def clock(label, cmd, setup=SETUP, number=None, repeat=REPEAT, target=TARGET_TIME):
+    """Time cmd and print min/median/IQR per execution in nanoseconds.
+
+    The loop count is calibrated so each repeat takes about target seconds
+    unless number is given, and one untimed warmup repeat runs first.
+    """
+    timer = timeit.Timer(cmd, setup=setup)
+    if number is None:
+        number = calibrate(timer, target)
+    timer.timeit(number)
+    res = summarize(label, number, timer.repeat(repeat, number))
+    print(label, f"{res['min'] * 1e9:10.1f} ns min {res['median'] * 1e9:10.1f} ns median "
+                 f"{res['iqr'] * 1e9:8.1f} ns IQR  ({number} loops x {repeat})")
+    return res
+
+def run_suite(suite, repeat=REPEAT, target=TARGET_TIME):
+    print(f"[{suite}]")
+    return [clock(label, cmd, setup, repeat=repeat, target=target) for label, cmd, setup in SUITES[suite]]
+
+def diff(old, new, threshold=THRESHOLD, min_repeat=MIN_REPEAT):
+    """Compare two saved result files case by case. A change is flagged as
+    significant when both cases have at least min_repeat repeats, the
+    interquartile ranges do not overlap and the medians differ by more than
+    threshold. With fewer repeats the quartiles say too little, and the
+    change is marked "few repeats" instead."""
+    rows = []
+    for suite, cases in new["suites"].items():
+        before = {case["label"]: case for case in old["suites"].get(suite, [])}
+        for case in cases:
+            prev = before.get(case["label"])
+            if prev is None:
+                continue
+            change = case["median"] / prev["median"] - 1
+            separated = case["q1"] > prev["q3"] or case["q3"] < prev["q1"]
+            if min(len(case["times"]), len(prev["times"])) < min_repeat:
+                flag = "few repeats"
+            elif separated and abs(change) > threshold:
+                flag = "slower" if change > 0 else "faster"
+            else:
+                flag = ""
+            rows.append((suite, case["label"], prev["median"], case["median"], change, flag))
+    return rows
+
+def print_diff(rows):
+    for suite, label, before, after, change, flag in rows:
+        print(f"[{suite}] {label} {before * 1e9:10.1f} ns -> {after * 1e9:10.1f} ns  {change:+7.1%}  {flag}")
+
+
+register('comprehensions', 'listcomp        :', '[ord(s) for s in symbols if ord(s) > 127]')
+register('comprehensions', 'listcomp + func :', '[ord(s) for s in symbols if non_ascii(ord(s))]')
+register('comprehensions', 'filter + lambda :', 'list(filter(lambda c: c > 127, map(ord, symbols)))')
+register('comprehensions', 'filter + func   :', 'list(filter(non_ascii, map(ord, symbols)))')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run registered micro-benchmark suites.")
+    parser.add_argument("suites", nargs="*", help=f"suites to run (default all: {', '.join(SUITES)})")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help=f"timed repeats per case (at least {MIN_REPEAT} for --diff to flag changes)")
+    parser.add_argument("--target", type=float, default=TARGET_TIME, help="seconds per timed repeat")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="compare two saved result files")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--min-repeat", type=int, default=MIN_REPEAT,
+                        help="repeats both runs need before --diff flags a change")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    if args.diff:
+        with open(args.diff[0]) as fp:
+            old = json.load(fp)
+        with open(args.diff[1]) as fp:
+            new = json.load(fp)
+        print_diff(diff(old, new, args.threshold, args.min_repeat))
+        return 0
+
+    results = {"python": sys.version, "suites": {}}
+    for suite in args.suites or SUITES:
+        results["suites"][suite] = run_suite(suite, args.repeat, args.target)
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
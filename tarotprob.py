@@ -0,0 +1,174 @@
+# Exact probabilities for card-count questions about tarot spreads.
+#
+#   engine = SpreadProbability()
+#   engine.probability(atLeast(engine.trumps, 3))
+#   engine.probability(exactly(engine.rank('King'), 2), atLeast(engine.named('The Tower'), 1))
+#
+# A spread is an unordered draw of spreadSize cards without replacement, so
+# every question about how many cards of some sets it holds is a
+# multivariate hypergeometric count. The sets may overlap: the deck is cut
+# into atoms (cards that belong to exactly the same constrained sets), and
+# a dynamic program over the atoms counts the spreads, with a memoized table
+# of binomial coefficients. crossCheck() runs the same query through the
+# Monte Carlo sampler for comparison.
+
+import collections
+from fractions import Fraction
+import math
+
+from tarotdeck import TarotDeck
+from tarotsampler import SPREAD_SIZE, SpreadSampler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# at least low and at most high (None: no upper limit) of cards in the spread
+Constraint = collections.namedtuple('Constraint', ['cards', 'low', 'high'])
+
+
+def atLeast(cards, count):
+    return Constraint(frozenset(cards), count, None)
+
+
+def atMost(cards, count):
+    return Constraint(frozenset(cards), 0, count)
+
+
+def exactly(cards, count):
+    return Constraint(frozenset(cards), count, count)
+
+
+def between(cards, low, high):
+    return Constraint(frozenset(cards), low, high)
+
+
+def allows(constraint, count):
+    return count >= constraint.low and (constraint.high is None or count <= constraint.high)
+
+
+class SpreadProbability:
+    """Counting and probability queries over the spreads of one deck.
+
+    Cards are deck indices; trumps, minor, suit(), rank() and named() give
+    the sets for the deck's categories. binomials[n][k] is C(n, k) for n up
+    to the deck size, built once.
+    """
+
+    def __init__(self, deck=None, spreadSize=SPREAD_SIZE):
+        self.deck = TarotDeck() if deck is None else deck
+        self.numCards = len(self.deck)
+        self.spreadSize = spreadSize
+        self.binomials = [[math.comb(n, k) for k in range(n + 1)] for n in range(self.numCards + 1)]
+        self.cache = {}
+        self.trumps = self.where(set='Trumps')
+        self.minor = self.where(set='Minor')
+
+    def where(self, **fields):
+        """Indices of the cards whose fields all equal the given values."""
+        return frozenset(i for i in range(self.numCards)
+                         if all(getattr(self.deck[i], field) == value for field, value in fields.items()))
+
+    def suit(self, suit):
+        if suit not in self.deck.minorArcanaSuites:
+            raise ValueError(f"no suit {suit!r}")
+        return self.where(set='Minor', name=suit)
+
+    def rank(self, rank):
+        if rank not in self.deck.minorArcanaRanks:
+            raise ValueError(f"no minor arcana rank {rank!r}")
+        return self.where(set='Minor', rank=rank)
+
+    def named(self, name):
+        cards = self.where(set='Trumps', name=name)
+        if not cards:
+            raise ValueError(f"no major arcana card {name!r}")
+        return cards
+
+    def comb(self, n, k):
+        return self.binomials[n][k] if 0 <= k <= n else 0
+
+    def totalSpreads(self):
+        return self.comb(self.numCards, self.spreadSize)
+
+    def count(self, *constraints):
+        """Number of spreads meeting every constraint."""
+        key = frozenset(constraints)
+        if key not in self.cache:
+            self.cache[key] = self.countSpreads(constraints)
+        return self.cache[key]
+
+    def probability(self, *constraints):
+        return Fraction(self.count(*constraints), self.totalSpreads())
+
+    def countSpreads(self, constraints):
+        # atoms: cards grouped by which constraint sets they are in
+        atoms = collections.Counter(
+            tuple(i for i, constraint in enumerate(constraints) if card in constraint.cards)
+            for card in range(self.numCards))
+        # counts above a constraint's limits all behave alike, so cap them
+        caps = [constraint.low if constraint.high is None else constraint.high + 1
+                for constraint in constraints]
+
+        # (cards drawn, capped count per constraint) -> number of ways
+        ways = {(0, (0,) * len(constraints)): 1}
+        for members, size in atoms.items():
+            nextWays = collections.defaultdict(int)
+            for (drawn, counts), n in ways.items():
+                for take in range(min(size, self.spreadSize - drawn) + 1):
+                    newCounts = list(counts)
+                    for i in members:
+                        newCounts[i] = min(caps[i], newCounts[i] + take)
+                    nextWays[drawn + take, tuple(newCounts)] += n * self.comb(size, take)
+            ways = nextWays
+
+        total = 0
+        for (drawn, counts), n in ways.items():
+            if drawn == self.spreadSize and all(map(allows, constraints, counts)):
+                total += n
+        return total
+
+    def crossCheck(self, *constraints, numSpreads=1_000_000, seed=None):
+        """(exact probability, Monte Carlo estimate, standard error, z score)
+        over numSpreads spreads from a SpreadSampler."""
+        exact = float(self.probability(*constraints))
+        sampler = SpreadSampler(self.deck, self.spreadSize, seed)
+        hits = 0
+        remaining = numSpreads
+        while remaining:
+            batch = min(remaining, 100_000)
+            remaining -= batch
+            spreads = sampler.sampleBatch(batch)
+            if sampler.vectorized:
+                ok = np.ones(batch, dtype=bool)
+                for constraint in constraints:
+                    member = np.zeros(self.numCards, dtype=bool)
+                    member[list(constraint.cards)] = True
+                    counts = member[spreads].sum(axis=1)
+                    ok &= counts >= constraint.low
+                    if constraint.high is not None:
+                        ok &= counts <= constraint.high
+                hits += int(ok.sum())
+            else:
+                hits += sum(all(allows(constraint, len(constraint.cards.intersection(spread)))
+                                for constraint in constraints)
+                            for spread in spreads)
+        estimate = hits / numSpreads
+        error = math.sqrt(exact * (1 - exact) / numSpreads)
+        z = (estimate - exact) / error if error else 0.0
+        return exact, estimate, error, z
+
+
+if __name__ == '__main__':
+    engine = SpreadProbability()
+    queries = {
+        "at least 3 Major Arcana": [atLeast(engine.trumps, 3)],
+        "exactly 2 Kings and The Tower": [exactly(engine.rank('King'), 2), atLeast(engine.named('The Tower'), 1)],
+        "no Cups": [exactly(engine.suit('Cups'), 0)],
+        "2+ Kings, 2+ Cups": [atLeast(engine.rank('King'), 2), atLeast(engine.suit('Cups'), 2)],
+    }
+    for label, constraints in queries.items():
+        p = engine.probability(*constraints)
+        exact, estimate, error, z = engine.crossCheck(*constraints, seed=1)
+        print(f"{label:<32} {float(p):.6f}  Monte Carlo {estimate:.6f} +- {error:.6f} (z {z:+.2f})")
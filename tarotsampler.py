@@ -0,0 +1,161 @@
+# Monte Carlo statistics over tarot spreads.
+#
+# Spreads are drawn as card indices 0..77 into a TarotDeck, never as Card
+# objects, with a partial Fisher-Yates shuffle: only the first spreadSize
+# swaps are made. With numpy a whole batch of spreads is shuffled at once,
+# one column swap per position across every row; without it each spread is
+# a random.Random.sample. After every batch the frequency tables are
+# updated in place, so a run can be stopped and read at any point.
+
+import random
+
+from tarotdeck import TarotDeck
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SPREAD_SIZE = 10
+BATCH_SIZE = 100_000
+EXACT_ROWS = 1 << 24        # float32 counts every integer up to 2**24 exactly
+
+
+class SpreadSampler:
+    """Draws spreads of spreadSize cards and keeps:
+
+    cardCounts[c]          spreads containing card c
+    positionCounts[p][c]   spreads with card c at position p
+    cooccurrence[a][b]     spreads containing both a and b (a != b); the
+                           diagonal is cardCounts
+
+    The numpy and pure Python modes draw different streams for the same
+    seed, each reproducible on its own.
+    """
+
+    def __init__(self, deck=None, spreadSize=SPREAD_SIZE, seed=None, vectorized=None):
+        self.deck = TarotDeck() if deck is None else deck
+        self.numCards = len(self.deck)
+        if not 0 < spreadSize <= self.numCards:
+            raise ValueError(f"spread size must be 1..{self.numCards}")
+        self.spreadSize = spreadSize
+        self.vectorized = np is not None if vectorized is None else vectorized
+        if self.vectorized and np is None:
+            raise ImportError("vectorized mode requires numpy")
+        self.numSpreads = 0
+        if self.vectorized:
+            self.rng = np.random.default_rng(seed)
+            self.cardCounts = np.zeros(self.numCards, dtype=np.int64)
+            self.positionCounts = np.zeros((spreadSize, self.numCards), dtype=np.int64)
+            self.cooccurrence = np.zeros((self.numCards, self.numCards), dtype=np.int64)
+        else:
+            self.rng = random.Random(seed)
+            self.cardCounts = [0] * self.numCards
+            self.positionCounts = [[0] * self.numCards for p in range(spreadSize)]
+            self.cooccurrence = [[0] * self.numCards for c in range(self.numCards)]
+
+    def sampleBatch(self, count):
+        """count spreads: a (count, spreadSize) array of card indices, or a
+        list of tuples without numpy."""
+        if not self.vectorized:
+            cards = range(self.numCards)
+            return [tuple(self.rng.sample(cards, self.spreadSize)) for i in range(count)]
+        n = self.numCards
+        decks = np.tile(np.arange(n, dtype=np.int8), (count, 1))
+        rows = np.arange(count)
+        for i in range(self.spreadSize):
+            # swap column i of every row with a random column i..n-1
+            j = i + self.rng.integers(0, n - i, size=count)
+            picked = decks[rows, j]
+            decks[rows, j] = decks[:, i]
+            decks[:, i] = picked
+        return decks[:, :self.spreadSize]
+
+    def addSpreads(self, spreads):
+        if self.vectorized:
+            n = self.numCards
+            for p in range(self.spreadSize):
+                self.positionCounts[p] += np.bincount(spreads[:, p], minlength=n)
+            # a float32 product is exact for up to EXACT_ROWS spreads, so
+            # bigger batches are counted a slice at a time
+            for start in range(0, len(spreads), EXACT_ROWS):
+                rows = spreads[start:start + EXACT_ROWS]
+                present = np.zeros((len(rows), n), dtype=np.float32)
+                np.put_along_axis(present, rows.astype(np.intp), 1, axis=1)
+                pairs = (present.T @ present).astype(np.int64)
+                self.cooccurrence += pairs
+                self.cardCounts += pairs.diagonal()
+        else:
+            cardCounts, positionCounts, cooccurrence = self.cardCounts, self.positionCounts, self.cooccurrence
+            for spread in spreads:
+                for p, card in enumerate(spread):
+                    positionCounts[p][card] += 1
+                    cardCounts[card] += 1
+                    cooccurrence[card][card] += 1
+                    row = cooccurrence[card]
+                    for other in spread[p + 1:]:
+                        row[other] += 1
+                        cooccurrence[other][card] += 1
+        self.numSpreads += len(spreads)
+
+    def run(self, numSpreads, batchSize=BATCH_SIZE):
+        if batchSize < 1:
+            raise ValueError("batch size must be at least 1")
+        while numSpreads > 0:
+            count = min(batchSize, numSpreads)
+            self.addSpreads(self.sampleBatch(count))
+            numSpreads -= count
+        return self
+
+    def cards(self, spread):
+        """The Card objects of a spread of indices, for display."""
+        return [self.deck[int(i)] for i in spread]
+
+    def cardFrequency(self, card):
+        return self.cardCounts[card] / self.numSpreads
+
+    def positionFrequency(self, position, card):
+        return self.positionCounts[position][card] / self.numSpreads
+
+    def pairFrequency(self, a, b):
+        return self.cooccurrence[a][b] / self.numSpreads
+
+    def topPairs(self, count=10):
+        """(frequency, cardA, cardB) for the most frequent pairs."""
+        pairs = [(self.cooccurrence[a][b], a, b)
+                 for a in range(self.numCards) for b in range(a + 1, self.numCards)]
+        pairs.sort(reverse=True)
+        return [(n / self.numSpreads, self.deck[a], self.deck[b]) for n, a, b in pairs[:count]]
+
+
+def benchmark(numSpreads=1_000_000, seed=1):
+    import time
+
+    start = time.perf_counter()
+    deck = TarotDeck()
+    for i in range(numSpreads // 100):
+        random.sample(list(deck), SPREAD_SIZE)
+    baseline = (time.perf_counter() - start) * 100
+    print(f"random.sample(list(deck), {SPREAD_SIZE}) x {numSpreads:,} (extrapolated): {baseline:.2f}s, no statistics")
+
+    modes = [False] + ([True] if np is not None else [])
+    for vectorized in modes:
+        sampler = SpreadSampler(seed=seed, vectorized=vectorized)
+        n = numSpreads if vectorized else numSpreads // 10
+        start = time.perf_counter()
+        sampler.run(n)
+        elapsed = time.perf_counter() - start
+        print(f"SpreadSampler(vectorized={vectorized}) {n:,} spreads with tables: {elapsed:.2f}s "
+              f"({n / elapsed:,.0f} spreads/s)")
+
+
+if __name__ == '__main__':
+    sampler = SpreadSampler(seed=1).run(1_000_000)
+    for card in sampler.cards(sampler.sampleBatch(1)[0]):
+        print(card)
+    expected = SPREAD_SIZE / sampler.numCards
+    print(f"{sampler.numSpreads:,} spreads, expected card frequency {expected:.4f}")
+    print("The Fool:", sampler.cardFrequency(0), "at position 0:", sampler.positionFrequency(0, 0) * SPREAD_SIZE)
+    for frequency, a, b in sampler.topPairs(3):
+        print(f"{frequency:.5f} {a.name} {a.rank} + {b.name} {b.rank}")
+    benchmark()
@@ -0,0 +1,380 @@
+# Autocomplete-style search over the Unicode character names.
+#
+#   search("LEFT ARR DOUB")               every term a word prefix (default)
+#   search("OWHEA", mode="substring")     terms anywhere inside a word
+#   search("LEFT ARROW", mode="word")     whole words, like unicodethingy
+#
+# Every term must match some word of the name (AND). Terms are resolved
+# against the vocabulary of name words rather than the names themselves:
+# prefixes by bisect on the sorted words, substrings through an index of the
+# one to three letter pieces of the words, and each matching word brings its
+# code points from the unicodethingy inverted index.
+#
+# Results are ranked lazily, so the first page costs the same whether a query
+# has ten matches or a hundred thousand. Every word's code points are also
+# kept in rank order, packed as name_length << RANK_SHIFT | cp so that plain
+# int order is rank order. One term drives the search: the rarest, as a
+# heapq.merge of its words' ranked postings, or, when it spans so many words
+# that the merge would cost more than a page, a walk down the ranked list of
+# all names. The other terms are checked against each candidate's name. A
+# rare driver that does not fill the page early is finished by intersecting
+# the terms' ranked postings as sets and sorting what is left, so narrow
+# queries never check more than a few names that do not match. The gram
+# index and ranked postings are cached like the unicodethingy index.
+
+import bisect
+import collections
+import heapq
+import itertools
+import os
+import pickle
+import unicodedata
+from array import array
+
+import unicodethingy
+
+MODES = ("prefix", "substring", "word")
+PAGE_SIZE = 20
+GRAM = 3
+RANK_SHIFT = 21             # code points fit in 21 bits
+CP_MASK = (1 << RANK_SHIFT) - 1
+TABLES_FORMAT = 3           # bumped whenever build_tables changes
+INTERSECT_LIMIT = 8192      # drivers up to this many postings may be intersected
+STREAM_SHARE = 16           # after streaming 1/16 of them without filling a page
+SET_RATIO = 8               # other terms up to this many postings per candidate too
+
+Match = collections.namedtuple("Match", ["code_point", "name"])
+
+_searcher = None
+
+
+def cache_path(version=unicodedata.unidata_version):
+    return os.path.join(unicodethingy.CACHE_DIR, f".unicode_search_{version}.pickle")
+
+
+def build_tables(index, sorted_words):
+    """Everything search needs beyond the unicodethingy index:
+
+    name_length[cp]     length of the name of every named code point
+    ranked              rank keys of every named code point, in order
+    ranked_postings     the rank keys of the names containing sorted_words[w],
+                        in order, at ranked_offsets[w]:ranked_offsets[w+1]
+    grams               every 1 to GRAM letter piece of a word; the words
+                        containing grams[i] are word numbers
+                        gram_words[gram_offsets[i]:gram_offsets[i+1]], which
+                        have gram_sizes[i] postings between them
+    """
+    name_length = bytearray(unicodethingy.UNIRANGE)
+    for cp in set(index.code_points):
+        name_length[cp] = len(unicodedata.name(chr(cp)))
+    ranked = array('I', sorted(length << RANK_SHIFT | cp for cp, length in enumerate(name_length) if length))
+    ranked_offsets = array('I', [0])
+    ranked_postings = array('I')
+    for word in sorted_words:
+        ranked_postings.extend(sorted(name_length[cp] << RANK_SHIFT | cp for cp in index.with_word(word)))
+        ranked_offsets.append(len(ranked_postings))
+    by_gram = collections.defaultdict(lambda: array('I'))
+    for i, word in enumerate(sorted_words):
+        pieces = {word[j:j + n] for n in range(1, GRAM + 1) for j in range(len(word) - n + 1)}
+        for gram in pieces:
+            by_gram[gram].append(i)
+    grams = sorted(by_gram)
+    gram_offsets = array('I', [0])
+    gram_words = array('I')
+    gram_sizes = array('I')
+    for gram in grams:
+        gram_words.extend(by_gram[gram])
+        gram_offsets.append(len(gram_words))
+        gram_sizes.append(sum(ranked_offsets[w + 1] - ranked_offsets[w] for w in by_gram[gram]))
+    return name_length, ranked, ranked_offsets, ranked_postings, grams, gram_offsets, gram_words, gram_sizes
+
+
+def load_tables(index, sorted_words, path=None):
+    """build_tables, cached next to the unicodethingy index."""
+    path = path or cache_path()
+    try:
+        with open(path, "rb") as fp:
+            version, table_format, tables = pickle.load(fp)
+        if version == unicodedata.unidata_version and table_format == TABLES_FORMAT:
+            return tables
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        pass
+    tables = build_tables(index, sorted_words)
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            pickle.dump((unicodedata.unidata_version, TABLES_FORMAT, tables), fp,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return tables
+
+
+class NameSearch:
+    """Search structures built from a unicodethingy.UnicodeIndex.
+
+    sorted_words holds the vocabulary in order; a word's number is its
+    position there. Prefixes are ranges of word numbers found by bisect and
+    substrings come from the gram index (see build_tables), so a term is
+    resolved to word numbers and a posting count without listing its words.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.sorted_words = sorted(index.words)
+        (self.name_length, self.ranked, self.ranked_offsets, self.ranked_postings,
+         self.grams, self.gram_offsets, self.gram_words, self.gram_sizes) = load_tables(index, self.sorted_words)
+        self.gram_positions = {gram: i for i, gram in enumerate(self.grams)}
+
+    def numbers_size(self, numbers):
+        offsets = self.ranked_offsets
+        if isinstance(numbers, range):
+            return offsets[numbers.stop] - offsets[numbers.start]
+        return sum(offsets[w + 1] - offsets[w] for w in numbers)
+
+    def prefix_numbers(self, prefix):
+        lo = bisect.bisect_left(self.sorted_words, prefix)
+        hi = bisect.bisect_left(self.sorted_words, prefix + "￿")
+        return range(lo, hi)
+
+    def substring_numbers(self, fragment):
+        """(word numbers, postings) of the words containing fragment."""
+        if len(fragment) <= GRAM:
+            i = self.gram_positions.get(fragment)
+            if i is None:
+                return range(0), 0
+            return memoryview(self.gram_words)[self.gram_offsets[i]:self.gram_offsets[i + 1]], self.gram_sizes[i]
+        # check the words of the fragment's rarest trigram
+        best = None
+        for j in range(len(fragment) - GRAM + 1):
+            i = self.gram_positions.get(fragment[j:j + GRAM])
+            if i is None:
+                return range(0), 0
+            lo, hi = self.gram_offsets[i], self.gram_offsets[i + 1]
+            if best is None or hi - lo < best[1] - best[0]:
+                best = lo, hi
+        words = self.sorted_words
+        numbers = [w for w in self.gram_words[best[0]:best[1]] if fragment in words[w]]
+        return numbers, self.numbers_size(numbers)
+
+    def term_numbers(self, term, mode):
+        """(word numbers, postings) of the words matching term."""
+        if mode == "prefix":
+            numbers = self.prefix_numbers(term)
+        elif mode == "substring":
+            return self.substring_numbers(term)
+        elif mode == "word":
+            w = bisect.bisect_left(self.sorted_words, term)
+            found = w < len(self.sorted_words) and self.sorted_words[w] == term
+            numbers = range(w, w + found)
+        else:
+            raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+        return numbers, self.numbers_size(numbers)
+
+    def prefix_words(self, prefix):
+        numbers = self.prefix_numbers(prefix)
+        return self.sorted_words[numbers.start:numbers.stop]
+
+    def substring_words(self, fragment):
+        return [self.sorted_words[w] for w in self.substring_numbers(fragment)[0]]
+
+    def term_words(self, term, mode):
+        return [self.sorted_words[w] for w in self.term_numbers(term, mode)[0]]
+
+    def postings(self, words):
+        """Code points of every name containing one of words, as one chain
+        of index slices."""
+        return itertools.chain.from_iterable(map(self.index.with_word, words))
+
+    def size(self, words):
+        positions, offsets = self.index.positions, self.index.offsets
+        return sum(offsets[positions[word] + 1] - offsets[positions[word]] for word in words)
+
+    def matches(self, query, mode="prefix"):
+        """Set of code points whose name matches every term of query."""
+        terms = query.upper().split()
+        if not terms:
+            return set()
+        candidates = []
+        for term in terms:
+            words = self.term_words(term, mode)
+            if not words:
+                return set()
+            candidates.append(words)
+        # only the rarest term becomes a set, the others are streamed through it
+        candidates.sort(key=self.size)
+        found = set(self.postings(candidates[0]))
+        for words in candidates[1:]:
+            found.intersection_update(self.postings(words))
+        return found
+
+    def ranked_stream(self, numbers, size, needed=PAGE_SIZE):
+        """Rank keys of the names containing one of the words numbered
+        numbers, best first, and whether the stream still has to be checked
+        against the term."""
+        # a merge pulls one key from every word up front; walking the full
+        # ranked list instead passes about len(ranked) / size names per match
+        if len(numbers) * size > needed * len(self.ranked):
+            return iter(self.ranked), True
+        offsets = self.ranked_offsets
+        postings = memoryview(self.ranked_postings)
+        if len(numbers) == 1:
+            return iter(postings[offsets[numbers[0]]:offsets[numbers[0] + 1]]), False
+        return heapq.merge(*(iter(postings[offsets[w]:offsets[w + 1]]) for w in numbers)), False
+
+    def term_slices(self, numbers):
+        """The ranked postings of the words numbered numbers, as memoryview
+        slices (one for a prefix, whose words are contiguous)."""
+        offsets, postings = self.ranked_offsets, memoryview(self.ranked_postings)
+        if isinstance(numbers, range):
+            return [postings[offsets[numbers.start]:offsets[numbers.stop]]]
+        return [postings[offsets[w]:offsets[w + 1]] for w in numbers]
+
+    def intersected_matches(self, needles, terms, order, exclude, start=0):
+        """ranked_matches from rank key start on, for a rare driving term:
+        the candidates are the intersection of the terms' rank key sets,
+        sorted once. A term with many more postings than there are
+        candidates left is checked against the candidates' names instead of
+        being turned into a set."""
+        found = set()
+        for postings in self.term_slices(terms[order[0]][0]):
+            found.update(postings)
+        checks = []
+        for i in order[1:]:
+            numbers, size = terms[i]
+            if size <= SET_RATIO * len(found):
+                # intersection() streams an iterable against the set without
+                # building a second one
+                found = set().union(*(found.intersection(postings) for postings in self.term_slices(numbers)))
+            else:
+                checks.append(needles[i])
+        found = sorted(found)
+        for key in itertools.islice(found, bisect.bisect_left(found, start), None):
+            cp = key & CP_MASK
+            if cp in exclude:
+                continue
+            name = unicodedata.name(chr(cp))
+            if not checks or all(needle in f" {name} " for needle in checks):
+                yield Match(cp, name)
+
+    def ranked_matches(self, needles, terms, exclude=frozenset()):
+        """Match for every name containing all needles, ranked by (name
+        length, code point), skipping the code points in exclude. terms
+        holds each needle's (word numbers, postings); the rarest drives the
+        search."""
+        order = sorted(range(len(terms)), key=lambda i: terms[i][1])
+        driver = order[0]
+        # Streaming finds a page quickly when most candidates match. For a
+        # rare driver, once the stream has passed a 1/STREAM_SHARE of its
+        # postings without filling the page, the rest is intersected
+        budget = terms[driver][1] // STREAM_SHARE if terms[driver][1] <= INTERSECT_LIMIT else None
+        stream, check_driver = self.ranked_stream(*terms[driver])
+        checks = [needle for i, needle in enumerate(needles) if check_driver or i != driver]
+        last = None
+        for key in stream:
+            if key == last:
+                continue    # the name has several words of the driving term
+            last = key
+            if budget is not None:
+                if not budget:
+                    yield from self.intersected_matches(needles, terms, order, exclude, key)
+                    return
+                budget -= 1
+            cp = key & CP_MASK
+            if cp in exclude:
+                continue
+            name = unicodedata.name(chr(cp))
+            padded = f" {name} "
+            if all(needle in padded for needle in checks):
+                yield Match(cp, name)
+
+    def search(self, query, mode="prefix"):
+        """Generator of Match, ranked by: names containing the terms as whole
+        words first, then shorter names, then code point. Nothing is ranked
+        ahead of what is read, so a page filled by the whole word matches
+        never starts the second pass."""
+        terms = query.upper().split()
+        resolved = [self.term_numbers(term, mode) for term in terms]
+        if not terms or not all(size for numbers, size in resolved):
+            return
+        # each term as a piece of " NAME " that is there exactly when it matches
+        whole = [f" {term} " for term in terms]
+        if mode == "word":
+            yield from self.ranked_matches(whole, resolved)
+            return
+        needles = [f" {term}" if mode == "prefix" else term for term in terms]
+        exact = [self.term_numbers(term, "word") for term in terms]
+        seen = set()
+        if all(size for numbers, size in exact):
+            for match in self.ranked_matches(whole, exact):
+                seen.add(match.code_point)
+                yield match
+        yield from self.ranked_matches(needles, resolved, seen)
+
+
+def get_searcher():
+    global _searcher
+    if _searcher is None:
+        _searcher = NameSearch(unicodethingy.get_index())
+    return _searcher
+
+
+def search(query, mode="prefix"):
+    return get_searcher().search(query, mode)
+
+
+def page(query, number=0, size=PAGE_SIZE, mode="prefix"):
+    """One page (from 0) of search results as a list."""
+    return list(itertools.islice(search(query, mode), number * size, (number + 1) * size))
+
+
+def full_scan(query):
+    """What unicodethingy used to do: every code point, whole-word terms."""
+    terms = query.upper().split()
+    found = []
+    for i in range(unicodethingy.UNIRANGE):
+        words = unicodedata.name(chr(i), '').split()
+        if all(term in words for term in terms):
+            found.append(i)
+    return found
+
+
+def benchmark(queries=("ARROW", "LEFT ARROW DOUBLE", "LEFT ARR DOUB", "GREEK SMALL", "CJK", "A", "AR", "E"),
+              repeat=200, target=1e-3):
+    """First page times of every query in every mode against the full scan.
+    Prints the slowest first page against target (seconds) and returns
+    whether it was met."""
+    import time
+
+    start = time.perf_counter()
+    get_searcher()
+    print(f"index and search tables: {(time.perf_counter() - start) * 1000:.1f} ms")
+    slowest = 0, None
+    for query in queries:
+        start = time.perf_counter()
+        scanned = full_scan(query)
+        scan = time.perf_counter() - start
+        for mode in MODES:
+            start = time.perf_counter()
+            for i in range(repeat):
+                results = page(query, mode=mode)
+            first_page = (time.perf_counter() - start) / repeat
+            slowest = max(slowest, (first_page, f"{query!r} {mode}"))
+            total = len(get_searcher().matches(query, mode))
+            print(f"{query!r:<22} {mode:<9} {total:6} matches, first page {first_page * 1e6:8.1f} us")
+        assert sorted(get_searcher().matches(query, "word")) == scanned
+        print(f"{query!r:<22} full scan {len(scanned):6} matches, {scan * 1000:8.1f} ms")
+    met = slowest[0] < target
+    print(f"slowest first page: {slowest[1]}, {slowest[0] * 1e6:.1f} us "
+          f"({'within' if met else 'MISSES'} the {target * 1e6:.0f} us target)")
+    return met
+
+
+if __name__ == "__main__":
+    benchmark()
+    print()
+    for match in page("LEFT ARR DOUB"):
+        print(unicodethingy.describe(match.code_point))
+    print()
+    for match in page("OWHEA", mode="substring", size=5):
+        print(unicodethingy.describe(match.code_point))
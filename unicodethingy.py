@@ -1,26 +1,126 @@
 # Find the most common words in the names of the unicode characters,
 # and also print out every character that has the word 'ARROW' in the name
+#
+# Scanning every code point with unicodedata.name takes over a second, so
+# build_index() does it once and keeps an inverted index (word -> code points
+# whose name contains it) plus the word counts in a cache file named after
+# unicodedata.unidata_version. Later runs load that file the first time an
+# index query is made.
 
 import sys
+import os
+import pickle
 import unicodedata
 import collections
+from array import array
 
 UNIRANGE = sys.maxunicode + 1
+CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-named = { unicodedata.name(chr(i))
-          for i in range(UNIRANGE)
-          if unicodedata.name(chr(i),'') }
+_index = None
 
-counter = collections.Counter()
-for name in named:
-    counter.update(name.split())
 
-print(counter.most_common(150))
+class UnicodeIndex:
+    """Inverted index of the character name words.
 
-arrows = ['{0} U+{1:X} {2}'.format(chr(i), i, unicodedata.name(chr(i),''))
-    for i in range(UNIRANGE)
-    if unicodedata.name(chr(i),'').split().__contains__('ARROW') ]
-              
-for arrow in arrows:
-    print(arrow)
-    
+    words lists every word once; the code points (ascending) of the names
+    containing words[i] are code_points[offsets[i]:offsets[i+1]]. Flat arrays
+    unpickle an order of magnitude faster than one array per word.
+    """
+    def __init__(self, version, words, offsets, code_points, counter):
+        self.version = version
+        self.words = words
+        self.offsets = offsets
+        self.code_points = code_points
+        self.counter = counter
+        self.positions = {word: i for i, word in enumerate(words)}
+
+    def with_word(self, word):
+        i = self.positions.get(word)
+        if i is None:
+            return array('I')
+        return self.code_points[self.offsets[i]:self.offsets[i + 1]]
+
+    def state(self):
+        # plain containers, so the file loads the same from __main__ or an import
+        return self.version, self.words, self.offsets, self.code_points, dict(self.counter)
+
+
+def cache_path(version=unicodedata.unidata_version):
+    return os.path.join(CACHE_DIR, f".unicode_names_{version}.pickle")
+
+
+def build_index():
+    """One pass over all code points with unicodedata.name."""
+    by_word = collections.defaultdict(lambda: array('I'))
+    counter = collections.Counter()
+    for i in range(UNIRANGE):
+        name = unicodedata.name(chr(i), '')
+        if name:
+            split = name.split()
+            counter.update(split)
+            for word in dict.fromkeys(split):
+                by_word[word].append(i)
+    words = list(by_word)
+    offsets = array('I', [0])
+    code_points = array('I')
+    for word in words:
+        code_points.extend(by_word[word])
+        offsets.append(len(code_points))
+    return UnicodeIndex(unicodedata.unidata_version, words, offsets, code_points, counter)
+
+
+def save_index(index, path=None):
+    path = path or cache_path(index.version)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fp:
+        pickle.dump(index.state(), fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_index(path=None):
+    """The cached index for this Python's unicodedata, built and saved
+    first if there is none (or it is unreadable or for another version)."""
+    path = path or cache_path()
+    try:
+        with open(path, "rb") as fp:
+            version, words, offsets, code_points, counter = pickle.load(fp)
+        if version == unicodedata.unidata_version:
+            return UnicodeIndex(version, words, offsets, code_points, collections.Counter(counter))
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        pass
+    index = build_index()
+    try:
+        save_index(index, path)
+    except OSError:
+        pass    # read-only checkout, just don't cache
+    return index
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = load_index()
+    return _index
+
+
+def with_word(word):
+    """Code points whose name contains word as a whole word."""
+    return get_index().with_word(word.upper())
+
+
+def most_common(n=None):
+    return get_index().counter.most_common(n)
+
+
+def describe(i):
+    return '{0} U+{1:X} {2}'.format(chr(i), i, unicodedata.name(chr(i),''))
+
+
+if __name__ == "__main__":
+    print(most_common(150))
+
+    arrows = [describe(i) for i in with_word('ARROW')]
+
+    for arrow in arrows:
+        print(arrow)
@@ -1,21 +1,226 @@
 from array import array
-from random import random
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import mmap
+import os
+import random
+import struct
+import sys
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 NUM_FLOATS = 10**7
 FILENAME = 'floats.bin'
+CHUNK_SIZE = 1 << 16        # items per write / per read chunk
+BLOCK_SIZE = 1 << 20        # floats per independently seeded block
+
+# A file is a 32 byte header followed by count items of typecode, stored
+# in the given byte order ('<' or '>'). The header is written with a count
+# of 0 and patched once the writer knows how many items it got, so a
+# writer can take any iterator without buffering it.
+MAGIC = b'PIEARRAY'
+FORMAT_VERSION = 1
+# magic, version, typecode, byte order, itemsize, count
+HEADER = struct.Struct('<8sHccB3xq8x')
+NATIVE_ORDER = '<' if sys.byteorder == 'little' else '>'
+# The CRC sidecar of generate_parallel: a header recording how the file
+# was cut into blocks, then one little-endian CRC-32 per block.
+CRC_MAGIC = b'PIECRC32'
+# magic, version, block size in items, item count
+CRC_HEADER = struct.Struct('<8sH6xqq')
+
+
+def write_array(filename, items, typecode='d', chunk_size=CHUNK_SIZE):
+    """Stream items (any iterable of numbers) to filename, chunk_size at a
+    time, and return how many were written. Memory stays at one chunk."""
+    items = iter(items)
+    count = 0
+    with open(filename, 'wb') as fp:
+        itemsize = array(typecode).itemsize
+        fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, typecode.encode(), NATIVE_ORDER.encode(), itemsize, 0))
+        while True:
+            chunk = array(typecode, itertools.islice(items, chunk_size))
+            if not chunk:
+                break
+            chunk.tofile(fp)
+            count += len(chunk)
+        fp.seek(0)
+        fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, typecode.encode(), NATIVE_ORDER.encode(), itemsize, count))
+    return count
+
+
+class ArrayFile:
+    """A file from write_array, memory-mapped read-only.
+
+    data is a memoryview cast straight onto the mapping, so nothing is read
+    or copied until it is indexed. A file written with the other byte order
+    cannot be cast; data is None then and chunks() byteswaps copies.
+    Use it as a context manager, or close() once every view is released.
+    """
+    def __init__(self, filename):
+        self.fp = open(filename, 'rb')
+        self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, typecode, order, itemsize, count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} has no array header")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{filename} has format version {version}, expected {FORMAT_VERSION}")
+        self.typecode = typecode.decode()
+        self.byteorder = order.decode()
+        self.itemsize = itemsize
+        self.count = count
+        if array(self.typecode).itemsize != itemsize:
+            raise ValueError(f"{filename} has {itemsize} byte '{self.typecode}' items, "
+                             f"this platform's are {array(self.typecode).itemsize}")
+        self.raw = memoryview(self.mm)[HEADER.size:HEADER.size + count * itemsize]
+        self.data = self.raw.cast(self.typecode) if self.byteorder == NATIVE_ORDER else None
+
+    def __len__(self):
+        return self.count
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Sequential scan: zero-copy memoryview slices of up to chunk_size
+        items, or byteswapped arrays for a foreign byte order file."""
+        step = chunk_size * self.itemsize
+        for start in range(0, len(self.raw), step):
+            if self.data is not None:
+                yield self.data[start // self.itemsize:(start + step) // self.itemsize]
+            else:
+                chunk = array(self.typecode)
+                chunk.frombytes(self.raw[start:start + step])
+                chunk.byteswap()
+                yield chunk
+
+    def to_array(self):
+        """A copy of the whole file as an array."""
+        copy = array(self.typecode)
+        copy.frombytes(self.raw)
+        if self.byteorder != NATIVE_ORDER:
+            copy.byteswap()
+        return copy
+
+    def close(self):
+        if self.data is not None:
+            self.data.release()
+        self.raw.release()
+        self.mm.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def block_floats(seed, block, count, use_numpy):
+    """The count floats of one block, from a stream seeded only by seed and
+    the block number. numpy and random give different streams."""
+    if use_numpy:
+        return np.random.default_rng([seed, block]).random(count)
+    rng = random.Random(f"{seed}/{block}")
+    return array('d', [rng.random() for i in range(count)])
+
+
+def _write_block(filename, seed, block, block_size, count, use_numpy):
+    """Generate one block and write it at its offset; returns its CRC-32."""
+    data = memoryview(block_floats(seed, block, count, use_numpy)).cast('B')
+    crc = zlib.crc32(data)
+    offset = HEADER.size + block * block_size * 8
+    fd = os.open(filename, os.O_WRONLY)
+    try:
+        if not hasattr(os, 'pwrite'):
+            os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.pwrite(fd, data, offset) if hasattr(os, 'pwrite') else os.write(fd, data)
+            data = data[written:]
+            offset += written
+    finally:
+        os.close(fd)
+    return crc
+
+
+def crc_filename(filename):
+    return filename + '.crc'
+
+
+def generate_parallel(filename, count, seed, workers=None, block_size=BLOCK_SIZE, use_numpy=None):
+    """Write count random floats to filename on a process pool.
+
+    The file is preallocated and each worker writes whole blocks straight
+    to their offsets. Block i is always rolled from (seed, i), so the file
+    is the same for any number of workers. The blocks' CRC-32s go to
+    crc_filename(filename), and the file is checked against them with
+    verify_file before returning; ValueError if any block is bad.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    with open(filename, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, b'd', NATIVE_ORDER.encode(), 8, count))
+        fp.truncate(HEADER.size + count * 8)
+    num_blocks = -(-count // block_size)
+    counts = [min(block_size, count - block * block_size) for block in range(num_blocks)]
+    args = (itertools.repeat(filename), itertools.repeat(seed), range(num_blocks),
+            itertools.repeat(block_size), counts, itertools.repeat(use_numpy))
+    if workers == 1:
+        crcs = list(map(_write_block, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            crcs = list(pool.map(_write_block, *args))
+    crc_array = array('I', crcs)
+    if sys.byteorder != 'little':
+        crc_array.byteswap()
+    with open(crc_filename(filename), 'wb') as fp:
+        fp.write(CRC_HEADER.pack(CRC_MAGIC, FORMAT_VERSION, block_size, count))
+        crc_array.tofile(fp)
+    bad = verify_file(filename)
+    if bad:
+        raise ValueError(f"{filename} blocks {bad} do not match their checksums after writing")
+    return crcs
+
 
-generator = (random() for i in range(NUM_FLOATS))
-floats = array('d', generator)
-print(floats[-1])
+def verify_file(filename):
+    """Block numbers whose contents no longer match the CRC-32s saved by
+    generate_parallel (an empty list if the file is intact). The block size
+    is read from the sidecar."""
+    with open(crc_filename(filename), 'rb') as fp:
+        header = fp.read(CRC_HEADER.size)
+        if len(header) != CRC_HEADER.size or header[:len(CRC_MAGIC)] != CRC_MAGIC:
+            raise ValueError(f"{crc_filename(filename)} has no checksum header")
+        magic, version, block_size, count = CRC_HEADER.unpack(header)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{crc_filename(filename)} has format version {version}, expected {FORMAT_VERSION}")
+        crcs = array('I')
+        crcs.frombytes(fp.read())
+    if sys.byteorder != 'little':
+        crcs.byteswap()
+    with ArrayFile(filename) as floats:
+        if len(floats) != count:
+            raise ValueError(f"{filename} has {len(floats)} items, the checksums cover {count}")
+        step = block_size * floats.itemsize
+        blocks = [zlib.crc32(floats.raw[start:start + step]) for start in range(0, len(floats.raw), step)]
+    if len(blocks) != len(crcs):
+        raise ValueError(f"{filename} has {len(blocks)} blocks, the checksums cover {len(crcs)}")
+    return [block for block, (crc, expected) in enumerate(zip(blocks, crcs)) if crc != expected]
 
-fp = open(FILENAME, 'wb')
-floats.tofile(fp)
-fp.close()
 
-floats2 = array('d')
-fp = open(FILENAME,'rb')
-floats2.fromfile(fp, NUM_FLOATS)
-fp.close()
+if __name__ == "__main__":
+    generator = (random.random() for i in range(NUM_FLOATS))
+    print(write_array(FILENAME, generator))
 
-print(floats2[-1])
+    with ArrayFile(FILENAME) as floats2:
+        print(len(floats2), floats2.typecode, floats2.byteorder)
+        print(floats2.data[-1])
+        print(max(max(chunk) for chunk in floats2.chunks()))
 
+    import time
+    for workers in (1, os.cpu_count()):
+        start = time.perf_counter()
+        crcs = generate_parallel(FILENAME, NUM_FLOATS, seed=1, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers} workers: {NUM_FLOATS} floats in {elapsed:.2f}s, crc of crcs {zlib.crc32(array('I', crcs))}")
+    print("bad blocks:", verify_file(FILENAME))